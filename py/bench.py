@@ -1,24 +1,14 @@
 from math import sqrt
 from time import perf_counter
+from time import time as perf_time
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
 from transonic import boost
 
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
-
-    # with numpy 1.20.3 and pandas 1.2.4
-    masses = np.ascontiguousarray(df["mass"].values)
-    positions = np.ascontiguousarray(df.loc[:, ["x", "y", "z"]].values)
-    velocities = np.ascontiguousarray(df.loc[:, ["vx", "vy", "vz"]].values)
-
-    return masses, positions, velocities
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
 
 
 def advance_positions(positions, velocities, accelerations, time_step):
@@ -34,9 +24,156 @@ def compute_distance(vec):
     return sqrt(sum(vec ** 2))
 
 
-def compute_accelerations(accelerations, masses, positions):
+@boost
+def compute_accelerations(
+    accelerations: "float[:,:]", masses: "float[]", positions: "float[:,:]"
+):
+    nb_particules = masses.size
+    vector = np.empty(3)
+    for index_p0 in range(nb_particules - 1):
+        position0 = positions[index_p0]
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            for i in range(3):
+                vector[i] = position0[i] - positions[index_p1, i]
+            distance = compute_distance(vector)
+            coef = 1.0 / distance ** 3
+            for i in range(3):
+                accelerations[index_p0, i] -= coef * mass1 * vector[i]
+                accelerations[index_p1, i] += coef * mass0 * vector[i]
+
+
+def compute_accelerations_tiled(accelerations, masses, positions, tile_size):
+    """Cache-blocked version of compute_accelerations
+
+    The pairs are visited tile by tile (i-block x j-block, upper triangle of
+    tiles only) so that the positions and accelerations of the two blocks stay
+    in cache during the inner loops.
+    """
+    nb_particules = masses.size
+    vector = np.empty(3)
+    acceleration0 = np.empty(3)
+    for start0 in range(0, nb_particules, tile_size):
+        stop0 = min(start0 + tile_size, nb_particules)
+        for start1 in range(start0, nb_particules, tile_size):
+            stop1 = min(start1 + tile_size, nb_particules)
+            for index_p0 in range(start0, stop0):
+                position0 = positions[index_p0]
+                mass0 = masses[index_p0]
+                acceleration0.fill(0)
+                # for the diagonal tiles, only the upper triangle
+                for index_p1 in range(max(index_p0 + 1, start1), stop1):
+                    mass1 = masses[index_p1]
+                    for i in range(3):
+                        vector[i] = position0[i] - positions[index_p1, i]
+                    distance = compute_distance(vector)
+                    coef = 1.0 / distance ** 3
+                    for i in range(3):
+                        acceleration0[i] -= coef * mass1 * vector[i]
+                        accelerations[index_p1, i] += coef * mass0 * vector[i]
+                for i in range(3):
+                    accelerations[index_p0, i] += acceleration0[i]
+
+
+def compute_accelerations_mixed(accelerations, masses32, positions32):
+    """Mixed precision version of compute_accelerations
+
+    The relative positions and 1/r**3 are computed in float32 (from float32
+    copies of the masses and positions), the accelerations are accumulated in
+    float64.
+    """
+    nb_particules = masses32.size
+    for index_p0 in range(nb_particules - 1):
+        x0 = positions32[index_p0, 0]
+        y0 = positions32[index_p0, 1]
+        z0 = positions32[index_p0, 2]
+        mass0 = masses32[index_p0]
+        ax = ay = az = 0.0
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            dx = x0 - positions32[index_p1, 0]
+            dy = y0 - positions32[index_p1, 1]
+            dz = z0 - positions32[index_p1, 2]
+            distance2 = dx * dx + dy * dy + dz * dz
+            coef = np.float32(1.0) / (distance2 * np.sqrt(distance2))
+            coef1 = masses32[index_p1] * coef
+            ax -= np.float64(coef1 * dx)
+            ay -= np.float64(coef1 * dy)
+            az -= np.float64(coef1 * dz)
+            coef0 = mass0 * coef
+            accelerations[index_p1, 0] += np.float64(coef0 * dx)
+            accelerations[index_p1, 1] += np.float64(coef0 * dy)
+            accelerations[index_p1, 2] += np.float64(coef0 * dz)
+        accelerations[index_p0, 0] += ax
+        accelerations[index_p0, 1] += ay
+        accelerations[index_p0, 2] += az
+
+
+def compute_accelerations_inv_sqrt32(
+    accelerations, masses, positions, nb_newton
+):
+    """compute_accelerations with 1/r estimated in float32
+
+    1/r is estimated with a float32 square root and a float32 division (no
+    bit-level trick, Pythran has no rsqrt function: whether the C++ compiler
+    uses an rsqrt instruction depends on its flags) and refined with
+    nb_newton Newton-Raphson iterations in float64 (each one doubles the
+    number of correct bits). 1/r**3 is then obtained with 2 multiplications.
+    The 3 steps are done on whole rows so that the loops are vectorized.
+    """
+    nb_particules = masses.size
+    dxs = np.empty(nb_particules)
+    dys = np.empty(nb_particules)
+    dzs = np.empty(nb_particules)
+    distances2 = np.empty(nb_particules)
+    inv_distances = np.empty(nb_particules)
+    for index_p0 in range(nb_particules - 1):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        mass0 = masses[index_p0]
+        start = index_p0 + 1
+        for index_p1 in range(start, nb_particules):
+            dx = x0 - positions[index_p1, 0]
+            dy = y0 - positions[index_p1, 1]
+            dz = z0 - positions[index_p1, 2]
+            dxs[index_p1] = dx
+            dys[index_p1] = dy
+            dzs[index_p1] = dz
+            distance2 = dx * dx + dy * dy + dz * dz
+            distances2[index_p1] = distance2
+            inv_distances[index_p1] = np.float32(1.0) / np.sqrt(
+                np.float32(distance2)
+            )
+        for _ in range(nb_newton):
+            inv_distances[start:] *= 1.5 - 0.5 * distances2[start:] * (
+                inv_distances[start:] ** 2
+            )
+        ax = ay = az = 0.0
+        for index_p1 in range(start, nb_particules):
+            dx = dxs[index_p1]
+            dy = dys[index_p1]
+            dz = dzs[index_p1]
+            inv_distance = inv_distances[index_p1]
+            coef = inv_distance * inv_distance * inv_distance
+            coef1 = masses[index_p1] * coef
+            ax -= coef1 * dx
+            ay -= coef1 * dy
+            az -= coef1 * dz
+            coef0 = mass0 * coef
+            accelerations[index_p1, 0] += coef0 * dx
+            accelerations[index_p1, 1] += coef0 * dy
+            accelerations[index_p1, 2] += coef0 * dz
+        accelerations[index_p0, 0] += ax
+        accelerations[index_p0, 1] += ay
+        accelerations[index_p0, 2] += az
+
+
+def compute_accelerations_energy(accelerations, masses, positions):
+    """compute_accelerations fused with compute_potential_energy"""
     nb_particules = masses.size
     vector = np.empty(3)
+    pe = 0.0
     for index_p0 in range(nb_particules - 1):
         position0 = positions[index_p0]
         mass0 = masses[index_p0]
@@ -49,44 +186,176 @@ def compute_accelerations(accelerations, masses, positions):
             for i in range(3):
                 accelerations[index_p0, i] -= coef * mass1 * vector[i]
                 accelerations[index_p1, i] += coef * mass0 * vector[i]
+            pe -= (mass0 * mass1) / distance
+    return pe
+
+
+def accelerate(
+    accelerations,
+    masses,
+    positions,
+    tile_size,
+    masses32,
+    positions32,
+    nb_newton_float32,
+):
+    if masses32.size:
+        positions32[:] = positions
+        compute_accelerations_mixed(accelerations, masses32, positions32)
+    elif nb_newton_float32 >= 0:
+        compute_accelerations_inv_sqrt32(
+            accelerations, masses, positions, nb_newton_float32
+        )
+    elif tile_size > 0:
+        compute_accelerations_tiled(
+            accelerations, masses, positions, tile_size
+        )
+    else:
+        compute_accelerations(accelerations, masses, positions)
 
 
 @boost
-def loop(
+def loop_phases(
     time_step: float,
     nb_steps: int,
     masses: "float[]",
     positions: "float[:,:]",
     velocities: "float[:,:]",
+    tile_size: int = 0,
+    fuse_energy: bool = False,
+    mixed_precision: bool = False,
+    nb_newton_float32: int = -1,
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
 ):
+    """Time steps, returns the energies and the durations of the phases
+
+    nb_newton_float32 >= 0: 1/r from float32 1/sqrt + Newton-Raphson
+    iterations (see compute_accelerations_inv_sqrt32)
+
+    step_start > 0: continuation of a simulation (see nbabel.engines)
+    """
 
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
 
-    compute_accelerations(accelerations, masses, positions)
+    # float32 copies for mixed precision (empty arrays otherwise)
+    nb_particules_32 = masses.size if mixed_precision else 0
+    masses32 = masses[:nb_particules_32].astype(np.float32)
+    positions32 = np.empty((nb_particules_32, 3), dtype=np.float32)
+
+    accelerate(
+        accelerations,
+        masses,
+        positions,
+        tile_size,
+        masses32,
+        positions32,
+        nb_newton_float32,
+    )
 
     time = 0.0
-    energy0, _, _ = compute_energies(masses, positions, velocities)
-    energy_previous = energy0
-
-    for step in range(nb_steps):
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, positions, velocities)
+        energy_previous = energy0
+    energy_pot = 0.0
+
+    perf_time_pos = 0.0
+    perf_time_swap = 0.0
+    perf_time_acc = 0.0
+    perf_time_vel = 0.0
+    perf_time_ener = 0.0
+
+    for step in range(step_start, step_start + nb_steps):
+        t0 = perf_time()
         advance_positions(positions, velocities, accelerations, time_step)
+        t1 = perf_time()
+        perf_time_pos += t1 - t0
         # swap acceleration arrays
         accelerations, accelerations1 = accelerations1, accelerations
         accelerations.fill(0)
-        compute_accelerations(accelerations, masses, positions)
+        t2 = perf_time()
+        perf_time_swap += t2 - t1
+        if fuse_energy and not step % 100:
+            # the potential energy is computed during the acceleration pass
+            energy_pot = compute_accelerations_energy(
+                accelerations, masses, positions
+            )
+        else:
+            accelerate(
+                accelerations,
+                masses,
+                positions,
+                tile_size,
+                masses32,
+                positions32,
+                nb_newton_float32,
+            )
+        t3 = perf_time()
+        perf_time_acc += t3 - t2
         advance_velocities(velocities, accelerations, accelerations1, time_step)
+        t4 = perf_time()
+        perf_time_vel += t4 - t3
         time += time_step
 
         if not step % 100:
-            energy, _, _ = compute_energies(masses, positions, velocities)
+            if fuse_energy:
+                energy = compute_kinetic_energy(masses, velocities) + energy_pot
+            else:
+                energy, _, _ = compute_energies(masses, positions, velocities)
             # f-strings supported by Pythran>=0.9.8
             print(
                 f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
                 f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
             )
             energy_previous = energy
+        perf_time_ener += perf_time() - t4
+
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
 
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    tile_size=0,
+    fuse_energy=False,
+    mixed_precision=False,
+    nb_newton_float32=-1,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """timing: print the times of the phases (JSON line, see nbabel.timing)"""
+    energy, energy0, durations = loop_phases(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        tile_size,
+        fuse_energy,
+        mixed_precision,
+        nb_newton_float32,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+    if timing:
+        emit_durations("pythran", masses.size, nb_steps, durations)
     return energy, energy0
 
 
@@ -123,13 +392,45 @@ if __name__ == "__main__":
     except IndexError:
         time_end = 10.
 
+    try:
+        # tile_size = 0 means no cache blocking
+        tile_size = int(sys.argv[3])
+    except IndexError:
+        tile_size = 0
+
+    try:
+        fuse_energy = bool(int(sys.argv[4]))
+    except IndexError:
+        fuse_energy = False
+
+    try:
+        mixed_precision = bool(int(sys.argv[5]))
+    except IndexError:
+        mixed_precision = False
+
+    try:
+        # -1: sqrt and division
+        nb_newton_float32 = int(sys.argv[6])
+    except IndexError:
+        nb_newton_float32 = -1
+
     time_step = 0.001
     nb_steps = int(time_end / time_step) + 1
 
     path_input = sys.argv[1]
     masses, positions, velocities = load_input_data(path_input)
 
-    energy, energy0 = loop(time_step, nb_steps, masses, positions, velocities)
+    energy, energy0 = loop(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        tile_size,
+        fuse_energy,
+        mixed_precision,
+        nb_newton_float32,
+    )
     print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
     print(
         f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
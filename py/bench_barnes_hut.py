@@ -0,0 +1,483 @@
+"""
+Barnes-Hut tree code (octree, multipole expansion up to quadrupole)
+
+The tree is stored in flat arrays so that the code can be compiled with
+Pythran. A node covers a contiguous range [start, stop) of the array `order`
+(permutation of the particle indices). Nodes are created in breadth first
+order so that the children of a node are contiguous and stored after their
+parent.
+
+A node is accepted (i.e. replaced by its multipole expansion) when
+size / distance < theta and the particle is not inside the cell.
+
+"""
+
+from math import sqrt
+from time import perf_counter
+from time import time as perf_time
+from datetime import timedelta
+
+import numpy as np
+
+from transonic import boost
+
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
+
+leaf_size = 8
+max_depth = 48
+
+
+def advance_positions(positions, velocities, accelerations, time_step):
+    positions += time_step * velocities + 0.5 * time_step ** 2 * accelerations
+
+
+def advance_velocities(velocities, accelerations, accelerations1, time_step):
+    velocities += 0.5 * time_step * (accelerations + accelerations1)
+
+
+def grow_int(arr, size):
+    result = np.zeros(size, dtype=np.int64)
+    result[: arr.size] = arr
+    return result
+
+
+def grow_float(arr, size):
+    result = np.zeros(size)
+    result[: arr.size] = arr
+    return result
+
+
+def grow_vectors(arr, size):
+    result = np.zeros((size, 3))
+    result[: arr.shape[0]] = arr
+    return result
+
+
+def build_tree(positions, order):
+    """Build the octree and reorder `order`
+
+    Returns the arrays (starts, stops, first_children, nb_children, centers,
+    half_sizes) of the nodes.
+    """
+    nb_particules = positions.shape[0]
+    for index in range(nb_particules):
+        order[index] = index
+
+    capacity = 2 * (nb_particules // leaf_size) + 64
+    starts = np.zeros(capacity, dtype=np.int64)
+    stops = np.zeros(capacity, dtype=np.int64)
+    depths = np.zeros(capacity, dtype=np.int64)
+    first_children = np.zeros(capacity, dtype=np.int64)
+    nb_children = np.zeros(capacity, dtype=np.int64)
+    centers = np.zeros((capacity, 3))
+    half_sizes = np.zeros(capacity)
+
+    pos_min = positions.min(axis=0)
+    pos_max = positions.max(axis=0)
+    half_size = 0.0
+    for i in range(3):
+        centers[0, i] = 0.5 * (pos_min[i] + pos_max[i])
+        half_size = max(half_size, 0.5 * (pos_max[i] - pos_min[i]))
+    # margin so that no particle is exactly on the boundary of the root
+    half_sizes[0] = half_size * (1.0 + 1e-10) + 1e-300
+    starts[0] = 0
+    stops[0] = nb_particules
+
+    octants = np.empty(nb_particules, dtype=np.int64)
+    tmp = np.empty(nb_particules, dtype=np.int64)
+    counts = np.empty(8, dtype=np.int64)
+    offsets = np.empty(8, dtype=np.int64)
+
+    nb_nodes = 1
+    index_node = 0
+    while index_node < nb_nodes:
+        start = starts[index_node]
+        stop = stops[index_node]
+        if stop - start <= leaf_size or depths[index_node] >= max_depth:
+            index_node += 1
+            continue
+
+        center = centers[index_node]
+        counts.fill(0)
+        for index in range(start, stop):
+            position = positions[order[index]]
+            octant = 0
+            for i in range(3):
+                if position[i] >= center[i]:
+                    octant += 1 << i
+            octants[index] = octant
+            counts[octant] += 1
+
+        # counting sort of the range by octant
+        offset = start
+        for octant in range(8):
+            offsets[octant] = offset
+            offset += counts[octant]
+        for index in range(start, stop):
+            octant = octants[index]
+            tmp[offsets[octant]] = order[index]
+            offsets[octant] += 1
+        for index in range(start, stop):
+            order[index] = tmp[index]
+
+        if nb_nodes + 8 > capacity:
+            capacity *= 2
+            starts = grow_int(starts, capacity)
+            stops = grow_int(stops, capacity)
+            depths = grow_int(depths, capacity)
+            first_children = grow_int(first_children, capacity)
+            nb_children = grow_int(nb_children, capacity)
+            centers = grow_vectors(centers, capacity)
+            half_sizes = grow_float(half_sizes, capacity)
+
+        half_child = 0.5 * half_sizes[index_node]
+        first_children[index_node] = nb_nodes
+        offset = start
+        for octant in range(8):
+            if counts[octant] == 0:
+                continue
+            starts[nb_nodes] = offset
+            offset += counts[octant]
+            stops[nb_nodes] = offset
+            depths[nb_nodes] = depths[index_node] + 1
+            half_sizes[nb_nodes] = half_child
+            for i in range(3):
+                if octant & (1 << i):
+                    centers[nb_nodes, i] = centers[index_node, i] + half_child
+                else:
+                    centers[nb_nodes, i] = centers[index_node, i] - half_child
+            nb_children[index_node] += 1
+            nb_nodes += 1
+
+        index_node += 1
+
+    return (
+        starts[:nb_nodes],
+        stops[:nb_nodes],
+        first_children[:nb_nodes],
+        nb_children[:nb_nodes],
+        centers[:nb_nodes],
+        half_sizes[:nb_nodes],
+    )
+
+
+def compute_multipoles(masses, positions, order, starts, stops):
+    """Mass, center of mass and traceless quadrupole of each node
+
+    quadrupoles[:, :] = (Qxx, Qyy, Qzz, Qxy, Qxz, Qyz) with
+    Q_ij = sum(m * (3 d_i d_j - d**2 delta_ij)) and d = x - com.
+    """
+    nb_nodes = starts.size
+    node_masses = np.zeros(nb_nodes)
+    coms = np.zeros((nb_nodes, 3))
+    quadrupoles = np.zeros((nb_nodes, 6))
+    vector = np.empty(3)
+    for index_node in range(nb_nodes):
+        mass_node = 0.0
+        com = coms[index_node]
+        for index in range(starts[index_node], stops[index_node]):
+            index_p = order[index]
+            mass = masses[index_p]
+            mass_node += mass
+            for i in range(3):
+                com[i] += mass * positions[index_p, i]
+        for i in range(3):
+            com[i] /= mass_node
+        node_masses[index_node] = mass_node
+
+        quad = quadrupoles[index_node]
+        for index in range(starts[index_node], stops[index_node]):
+            index_p = order[index]
+            mass = masses[index_p]
+            for i in range(3):
+                vector[i] = positions[index_p, i] - com[i]
+            d2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+            for i in range(3):
+                quad[i] += mass * (3 * vector[i] ** 2 - d2)
+            quad[3] += 3 * mass * vector[0] * vector[1]
+            quad[4] += 3 * mass * vector[0] * vector[2]
+            quad[5] += 3 * mass * vector[1] * vector[2]
+
+    return node_masses, coms, quadrupoles
+
+
+def compute_acceleration_particle(
+    index_p0,
+    acceleration,
+    theta,
+    masses,
+    positions,
+    order,
+    starts,
+    stops,
+    first_children,
+    nb_children,
+    centers,
+    half_sizes,
+    node_masses,
+    coms,
+    quadrupoles,
+):
+    """Tree walk for one particle, returns its potential"""
+    position0 = positions[index_p0]
+    theta2 = theta ** 2
+    potential = 0.0
+    for i in range(3):
+        acceleration[i] = 0.0
+    vector = np.empty(3)
+    stack = np.empty(8 * (max_depth + 1), dtype=np.int64)
+    stack[0] = 0
+    nb_stacked = 1
+    while nb_stacked > 0:
+        nb_stacked -= 1
+        index_node = stack[nb_stacked]
+
+        for i in range(3):
+            vector[i] = position0[i] - coms[index_node, i]
+        distance2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+        size = 2 * half_sizes[index_node]
+
+        accepted = size ** 2 < theta2 * distance2
+        if accepted:
+            # a cell containing the particle has to be opened
+            inside = True
+            for i in range(3):
+                if abs(position0[i] - centers[index_node, i]) > half_sizes[
+                    index_node
+                ]:
+                    inside = False
+            accepted = not inside
+
+        if accepted:
+            quad = quadrupoles[index_node]
+            x = vector[0]
+            y = vector[1]
+            z = vector[2]
+            inv_distance2 = 1.0 / distance2
+            inv_distance = sqrt(inv_distance2)
+            inv_distance3 = inv_distance * inv_distance2
+            inv_distance5 = inv_distance3 * inv_distance2
+            inv_distance7 = inv_distance5 * inv_distance2
+            # Q . r
+            qr0 = quad[0] * x + quad[3] * y + quad[4] * z
+            qr1 = quad[3] * x + quad[1] * y + quad[5] * z
+            qr2 = quad[4] * x + quad[5] * y + quad[2] * z
+            rqr = x * qr0 + y * qr1 + z * qr2
+            mass = node_masses[index_node]
+            coef = -mass * inv_distance3 - 2.5 * rqr * inv_distance7
+            acceleration[0] += coef * vector[0] + qr0 * inv_distance5
+            acceleration[1] += coef * vector[1] + qr1 * inv_distance5
+            acceleration[2] += coef * vector[2] + qr2 * inv_distance5
+            potential -= mass * inv_distance + 0.5 * rqr * inv_distance5
+        elif nb_children[index_node] == 0:
+            for index in range(starts[index_node], stops[index_node]):
+                index_p1 = order[index]
+                if index_p1 == index_p0:
+                    continue
+                for i in range(3):
+                    vector[i] = position0[i] - positions[index_p1, i]
+                distance2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+                inv_distance = 1.0 / sqrt(distance2)
+                coef = masses[index_p1] * inv_distance ** 3
+                for i in range(3):
+                    acceleration[i] -= coef * vector[i]
+                potential -= masses[index_p1] * inv_distance
+        else:
+            first_child = first_children[index_node]
+            for index_child in range(
+                first_child, first_child + nb_children[index_node]
+            ):
+                stack[nb_stacked] = index_child
+                nb_stacked += 1
+
+    return potential
+
+
+@boost
+def compute_accelerations(
+    accelerations: "float[:,:]",
+    potentials: "float[]",
+    masses: "float[]",
+    positions: "float[:,:]",
+    theta: float,
+):
+    """Accelerations and potentials computed with the tree"""
+    nb_particules = masses.size
+    order = np.empty(nb_particules, dtype=np.int64)
+    (
+        starts,
+        stops,
+        first_children,
+        nb_children,
+        centers,
+        half_sizes,
+    ) = build_tree(positions, order)
+    node_masses, coms, quadrupoles = compute_multipoles(
+        masses, positions, order, starts, stops
+    )
+    # particles close in the tree are processed consecutively
+    for index in range(nb_particules):
+        index_p0 = order[index]
+        potentials[index_p0] = compute_acceleration_particle(
+            index_p0,
+            accelerations[index_p0],
+            theta,
+            masses,
+            positions,
+            order,
+            starts,
+            stops,
+            first_children,
+            nb_children,
+            centers,
+            half_sizes,
+            node_masses,
+            coms,
+            quadrupoles,
+        )
+
+
+@boost
+def loop_phases(
+    time_step: float,
+    nb_steps: int,
+    masses: "float[]",
+    positions: "float[:,:]",
+    velocities: "float[:,:]",
+    theta: float = 0.5,
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
+):
+    """Time steps, returns the energies and the durations of the phases
+
+    step_start > 0: continuation of a simulation (see nbabel.engines)
+    """
+
+    accelerations = np.zeros_like(positions)
+    accelerations1 = np.zeros_like(positions)
+    potentials = np.zeros_like(masses)
+
+    compute_accelerations(accelerations, potentials, masses, positions, theta)
+
+    time = 0.0
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, velocities, potentials)
+        energy_previous = energy0
+
+    perf_time_pos = 0.0
+    perf_time_swap = 0.0
+    perf_time_acc = 0.0
+    perf_time_vel = 0.0
+    perf_time_ener = 0.0
+
+    for step in range(step_start, step_start + nb_steps):
+        t0 = perf_time()
+        advance_positions(positions, velocities, accelerations, time_step)
+        t1 = perf_time()
+        perf_time_pos += t1 - t0
+        # swap acceleration arrays
+        accelerations, accelerations1 = accelerations1, accelerations
+        t2 = perf_time()
+        perf_time_swap += t2 - t1
+        compute_accelerations(
+            accelerations, potentials, masses, positions, theta
+        )
+        t3 = perf_time()
+        perf_time_acc += t3 - t2
+        advance_velocities(velocities, accelerations, accelerations1, time_step)
+        t4 = perf_time()
+        perf_time_vel += t4 - t3
+        time += time_step
+
+        if not step % 100:
+            # the potentials have just been computed with the tree
+            energy, _, _ = compute_energies(masses, velocities, potentials)
+            print(
+                f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+            energy_previous = energy
+        perf_time_ener += perf_time() - t4
+
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    theta=0.5,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """timing: print the times of the phases (JSON line, see nbabel.timing)"""
+    energy, energy0, durations = loop_phases(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        theta,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+    if timing:
+        # equivalent direct-summation rates (see nbabel.timing)
+        emit_durations("barnes-hut", masses.size, nb_steps, durations)
+    return energy, energy0
+
+
+def compute_kinetic_energy(masses, velocities):
+    return 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+
+
+def compute_energies(masses, velocities, potentials):
+    energy_kin = compute_kinetic_energy(masses, velocities)
+    energy_pot = 0.5 * np.sum(masses * potentials)
+    return energy_kin + energy_pot, energy_kin, energy_pot
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        theta = float(sys.argv[3])
+    except IndexError:
+        theta = 0.5
+
+    time_step = 0.001
+    nb_steps = int(time_end / time_step) + 1
+
+    path_input = sys.argv[1]
+    masses, positions, velocities = load_input_data(path_input)
+
+    energy, energy0 = loop(
+        time_step, nb_steps, masses, positions, velocities, theta
+    )
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
+    )
@@ -0,0 +1,429 @@
+"""Hermite scheme with hierarchical block time steps (Makino & Aarseth, 1992)
+
+python bench_block_steps.py ../data/input1k 1 0.02
+
+Each particle has its own time step (power of 2 fraction of
+time_step_max, Aarseth criterion
+dt = sqrt(eta * (|a| |a2| + |a1|**2) / (|a1| |a3| + |a2|**2)), with the
+standard eta ~ 0.02). At each block step, only the forces on the
+active particles (the ones whose time step ends at the block time) are
+computed, from all particles predicted to the block time. All particles are
+synchronized every time_step_max, which is when the energy is computed.
+The time steps are bounded by time_step_max / 2**max_level (RuntimeError if a
+smaller time step is needed, for example for coincident particles).
+
+`loop` has the signature of the other engines (engine "block-steps" of
+nbabel.engines, time_step is the largest time step).
+
+The scheduler (selection of the active particles) is written with Numpy and
+the kernels are compiled with Pythran (a compiled `loop` function takes too
+much memory to compile).
+
+"""
+
+from math import floor, log2, sqrt
+from time import perf_counter
+from datetime import timedelta
+
+import numpy as np
+
+from transonic import boost, Array
+
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers
+
+# C order to limit the number of overloads (many 2d arrays)
+A2d = Array[np.float64, "2d", "C"]
+
+
+@boost
+def compute_accelerations_jerks_active(
+    accelerations: A2d,
+    jerks: A2d,
+    active: "int[]",
+    masses: "float[]",
+    positions: A2d,
+    velocities: A2d,
+):
+    """Accelerations and jerks of the active particles (i) due to all (j)"""
+    nb_particules = masses.size
+    vector = np.empty(3)
+    vector_vel = np.empty(3)
+    acceleration0 = np.empty(3)
+    jerk0 = np.empty(3)
+    for index_active in range(active.size):
+        index_p0 = active[index_active]
+        position0 = positions[index_p0]
+        velocity0 = velocities[index_p0]
+        acceleration0.fill(0)
+        jerk0.fill(0)
+        for index_p1 in range(nb_particules):
+            if index_p1 == index_p0:
+                continue
+            mass1 = masses[index_p1]
+            for i in range(3):
+                vector[i] = position0[i] - positions[index_p1, i]
+                vector_vel[i] = velocity0[i] - velocities[index_p1, i]
+            distance2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+            coef = mass1 / (distance2 * sqrt(distance2))
+            coef_vel = (
+                3.0
+                * (
+                    vector[0] * vector_vel[0]
+                    + vector[1] * vector_vel[1]
+                    + vector[2] * vector_vel[2]
+                )
+                / distance2
+            )
+            for i in range(3):
+                acceleration0[i] -= coef * vector[i]
+                jerk0[i] -= coef * (vector_vel[i] - coef_vel * vector[i])
+        for i in range(3):
+            accelerations[index_p0, i] = acceleration0[i]
+            jerks[index_p0, i] = jerk0[i]
+
+
+def norm(vec):
+    return sqrt(vec[0] ** 2 + vec[1] ** 2 + vec[2] ** 2)
+
+
+def compute_initial_time_steps(
+    accelerations, jerks, eta_start, time_step_max, max_level
+):
+    """Largest time_step_max / 2**k smaller than eta_start * |a| / |j|"""
+    time_steps_ideal = (
+        eta_start
+        * np.sqrt(np.sum(accelerations ** 2, 1))
+        / np.sqrt(np.sum(jerks ** 2, 1))
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exponents = np.ceil(np.log2(time_step_max / time_steps_ideal))
+    # also for NaN (a = j = 0)
+    if not np.all(exponents <= max_level):
+        raise RuntimeError(
+            f"Initial time step smaller than time_step_max / 2**{max_level}"
+        )
+    return time_step_max * 2.0 ** -np.maximum(exponents, 0)
+
+
+@boost
+def predict(
+    positions_pred: A2d,
+    velocities_pred: A2d,
+    positions: A2d,
+    velocities: A2d,
+    accelerations: A2d,
+    jerks: A2d,
+    times: "float[]",
+    time: float,
+):
+    """Predict all particles at `time` (3rd order Taylor expansions)"""
+    for index in range(times.size):
+        dt = time - times[index]
+        for i in range(3):
+            acc = accelerations[index, i]
+            jerk = jerks[index, i]
+            positions_pred[index, i] = positions[index, i] + dt * (
+                velocities[index, i] + dt * (0.5 * acc + dt / 6 * jerk)
+            )
+            velocities_pred[index, i] = velocities[index, i] + dt * (
+                acc + 0.5 * dt * jerk
+            )
+
+
+@boost
+def correct_active(
+    active: "int[]",
+    positions: A2d,
+    velocities: A2d,
+    accelerations: A2d,
+    jerks: A2d,
+    positions_pred: A2d,
+    velocities_pred: A2d,
+    accelerations1: A2d,
+    jerks1: A2d,
+    times: "float[]",
+    time_steps: "float[]",
+    time: float,
+    eta: float,
+    time_step_max: float,
+    time_step_min: float,
+):
+    """Hermite corrector and new time steps of the active particles"""
+    snap = np.empty(3)
+    crackle = np.empty(3)
+    for index_active in range(active.size):
+        index = active[index_active]
+        dt = time_steps[index]
+        for i in range(3):
+            acc0 = accelerations[index, i]
+            acc1 = accelerations1[index, i]
+            jerk0 = jerks[index, i]
+            jerk1 = jerks1[index, i]
+            # 2nd and 3rd derivatives of the acceleration at the start
+            # of the step from the Hermite interpolation
+            snap0 = (-6 * (acc0 - acc1) - dt * (4 * jerk0 + 2 * jerk1)) / dt**2
+            crackle[i] = (12 * (acc0 - acc1) + 6 * dt * (jerk0 + jerk1)) / (
+                dt**3
+            )
+            positions[index, i] = positions_pred[index, i] + dt**4 * (
+                snap0 / 24 + dt * crackle[i] / 120
+            )
+            velocities[index, i] = velocities_pred[index, i] + dt**3 * (
+                snap0 / 6 + dt * crackle[i] / 24
+            )
+            # snap at the end of the step
+            snap[i] = snap0 + dt * crackle[i]
+        for i in range(3):
+            accelerations[index, i] = accelerations1[index, i]
+            jerks[index, i] = jerks1[index, i]
+        times[index] = time
+
+        # Aarseth criterion (eta inside the square root, Makino & Aarseth 1992)
+        norm_snap = norm(snap)
+        norm_jerk = norm(jerks[index])
+        time_step_ideal = sqrt(
+            eta
+            * (norm(accelerations[index]) * norm_snap + norm_jerk**2)
+            / (norm_jerk * norm(crackle) + norm_snap**2)
+        )
+        # the new time step is a power of 2 fraction of time_step_max and
+        # the block has to be commensurate with it
+        if time_step_ideal < dt:
+            while dt > time_step_ideal:
+                dt *= 0.5
+                # time_step_ideal can be 0 (coincident particles)
+                if dt < time_step_min:
+                    raise RuntimeError(
+                        "Time step smaller than time_step_max / 2**max_level"
+                    )
+        elif (
+            time_step_ideal >= 2 * dt
+            and 2 * dt <= time_step_max
+            and time % (2 * dt) == 0.0
+        ):
+            dt *= 2
+        time_steps[index] = dt
+
+
+def loop_blocks(
+    time_step_max,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    eta=0.02,
+    eta_start=0.01,
+    max_level=30,
+    timers=None,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """nb_steps synchronization steps of time_step_max
+
+    The time steps of the particles are time_step_max / 2**k with
+    k <= max_level (RuntimeError for smaller time steps). eta_start is the
+    parameter of the criterion of the initial time steps (eta_start |a| / |j|).
+
+    step_start > 0 (in synchronization steps): continuation of a simulation
+    (see nbabel.engines). The time steps of the particles are initialized
+    again with the criterion of the initial time steps.
+
+    Returns energy, energy0, nb_blocks, nb_particle_steps.
+    """
+    if timers is None:
+        timers = PhaseTimers(enabled=False)
+
+    accelerations = np.zeros_like(positions)
+    jerks = np.zeros_like(positions)
+    accelerations1 = np.zeros_like(positions)
+    jerks1 = np.zeros_like(positions)
+    positions_pred = np.empty_like(positions)
+    velocities_pred = np.empty_like(positions)
+    time = step_start * time_step_max
+    times = np.full(masses.size, time)
+
+    compute_accelerations_jerks_active(
+        accelerations,
+        jerks,
+        np.arange(masses.size),
+        masses,
+        positions,
+        velocities,
+    )
+    time_steps = compute_initial_time_steps(
+        accelerations, jerks, eta_start, time_step_max, max_level
+    )
+    time_step_min = time_step_max * 2.0 ** -max_level
+
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, positions, velocities)
+        energy_previous = energy0
+    energy = energy_previous
+
+    nb_blocks = 0
+    nb_particle_steps = 0
+
+    step_stop = step_start + nb_steps
+    for step in range(step_start, step_stop):
+        time_sync = (step + 1) * time_step_max
+        while time < time_sync:
+            times_next = times + time_steps
+            time = times_next.min()
+            active = np.flatnonzero(times_next == time)
+
+            with timers.phase("pos"):
+                predict(
+                    positions_pred,
+                    velocities_pred,
+                    positions,
+                    velocities,
+                    accelerations,
+                    jerks,
+                    times,
+                    time,
+                )
+            with timers.phase("acc"):
+                compute_accelerations_jerks_active(
+                    accelerations1,
+                    jerks1,
+                    active,
+                    masses,
+                    positions_pred,
+                    velocities_pred,
+                )
+            with timers.phase("vel"):
+                correct_active(
+                    active,
+                    positions,
+                    velocities,
+                    accelerations,
+                    jerks,
+                    positions_pred,
+                    velocities_pred,
+                    accelerations1,
+                    jerks1,
+                    times,
+                    time_steps,
+                    time,
+                    eta,
+                    time_step_max,
+                    time_step_min,
+                )
+            nb_blocks += 1
+            nb_particle_steps += active.size
+
+        # all particles are synchronized
+        if not step % 100 or step == step_stop - 1:
+            with timers.phase("ener"):
+                energy, _, _ = compute_energies(masses, positions, velocities)
+                print(
+                    f"t = {time:5.2f}, E = {energy:.10f}, dE/E = "
+                    f"{(energy - energy_previous) / energy_previous:+.10f}"
+                )
+            energy_previous = energy
+
+    return energy, energy0, nb_blocks, nb_particle_steps
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    eta=0.02,
+    eta_start=0.01,
+    max_level=30,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """Same signature as the other engines
+
+    time_step is rounded down to a power of 2 (time_step_max, so that the
+    block times are exact) and the number of synchronization steps is the
+    one giving the closest final time (nb_steps * time_step). The same
+    rounding is used for step_start.
+    """
+    time_step_max = 2.0 ** floor(log2(time_step))
+    step_start_max = round(step_start * time_step / time_step_max)
+    nb_steps_max = (
+        round((step_start + nb_steps) * time_step / time_step_max)
+        - step_start_max
+    )
+    timers = PhaseTimers(enabled=timing)
+    energy, energy0, _, _ = loop_blocks(
+        time_step_max,
+        nb_steps_max,
+        masses,
+        positions,
+        velocities,
+        eta,
+        eta_start,
+        max_level,
+        timers,
+        step_start_max,
+        energy0,
+        energy_previous,
+    )
+    timers.emit("block-steps", masses.size, nb_steps_max)
+    return energy, energy0
+
+
+def compute_kinetic_energy(masses, velocities):
+    return 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+
+
+@boost
+def compute_potential_energy(masses: "float[]", positions: A2d):
+    nb_particules = masses.size
+    pe = 0.0
+    for index_p0 in range(nb_particules - 1):
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            vector = positions[index_p0] - positions[index_p1]
+            distance = sqrt(sum(vector ** 2))
+            pe -= (mass0 * mass1) / distance
+    return pe
+
+
+def compute_energies(masses, positions, velocities):
+    energy_kin = compute_kinetic_energy(masses, velocities)
+    energy_pot = compute_potential_energy(masses, positions)
+    return energy_kin + energy_pot, energy_kin, energy_pot
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        eta = float(sys.argv[3])
+    except IndexError:
+        eta = 0.02
+
+    time_step_max = 2**-7
+    nb_steps = int(round(time_end / time_step_max))
+
+    path_input = sys.argv[1]
+    masses, positions, velocities = load_input_data(path_input)
+
+    energy, energy0, nb_blocks, nb_particle_steps = loop_blocks(
+        time_step_max, nb_steps, masses, positions, velocities, eta
+    )
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_blocks} block steps, {nb_particle_steps / nb_blocks:.1f} active "
+        "particles per block on average"
+    )
+    print(f"run in {timedelta(seconds=perf_counter()-t_start)}")
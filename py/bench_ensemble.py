@@ -0,0 +1,165 @@
+"""Ensemble of independent small systems advanced in one call
+
+python bench_ensemble.py ../data/input64 256 1
+
+The arrays of the systems are stacked (shapes (n_systems, N) and
+(n_systems, N, 3)) and the systems are integrated in parallel (one system per
+OpenMP thread, so compile with -fopenmp). The total energy of each system is
+recorded every 100 time steps (array of shape (n_systems, nb_records)).
+
+For a benchmark, the ensemble is made of randomly rotated copies of one input
+file. Different realisations with the same number of particles can be stacked
+with nbabel.input_data.load_ensemble.
+
+"""
+
+from math import sqrt
+from time import perf_counter
+from datetime import timedelta
+
+import numpy as np
+
+from transonic import boost
+
+from nbabel.input_data import load_input_data
+
+period_energy = 100
+
+
+def compute_accelerations(accelerations, masses, positions):
+    nb_particules = masses.size
+    vector = np.empty(3)
+    for index_p0 in range(nb_particules - 1):
+        position0 = positions[index_p0]
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            for i in range(3):
+                vector[i] = position0[i] - positions[index_p1, i]
+            distance2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+            coef = 1.0 / (distance2 * sqrt(distance2))
+            for i in range(3):
+                accelerations[index_p0, i] -= coef * mass1 * vector[i]
+                accelerations[index_p1, i] += coef * mass0 * vector[i]
+
+
+def compute_energy(masses, positions, velocities):
+    energy = 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+    nb_particules = masses.size
+    for index_p0 in range(nb_particules - 1):
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            distance = sqrt(
+                (positions[index_p0, 0] - positions[index_p1, 0]) ** 2
+                + (positions[index_p0, 1] - positions[index_p1, 1]) ** 2
+                + (positions[index_p0, 2] - positions[index_p1, 2]) ** 2
+            )
+            energy -= mass0 * masses[index_p1] / distance
+    return energy
+
+
+def loop_system(time_step, nb_steps, masses, positions, velocities, energies):
+    """Leapfrog of bench.py (without prints) for one system"""
+    accelerations = np.zeros_like(positions)
+    accelerations1 = np.zeros_like(positions)
+    compute_accelerations(accelerations, masses, positions)
+    energies[0] = compute_energy(masses, positions, velocities)
+
+    for step in range(nb_steps):
+        positions += (
+            time_step * velocities + 0.5 * time_step ** 2 * accelerations
+        )
+        accelerations, accelerations1 = accelerations1, accelerations
+        accelerations.fill(0)
+        compute_accelerations(accelerations, masses, positions)
+        velocities += 0.5 * time_step * (accelerations + accelerations1)
+
+        if not (step + 1) % period_energy:
+            energies[(step + 1) // period_energy] = compute_energy(
+                masses, positions, velocities
+            )
+
+
+@boost
+def loop(
+    time_step: float,
+    nb_steps: int,
+    masses: "float[:,:]",
+    positions: "float[:,:,:]",
+    velocities: "float[:,:,:]",
+):
+    """Integrate all systems, return the energies (n_systems, nb_records)
+
+    The energies are recorded at t = 0 and every 100 time steps.
+    """
+    nb_systems = masses.shape[0]
+    energies = np.zeros((nb_systems, nb_steps // period_energy + 1))
+
+    # omp parallel for schedule(dynamic)
+    for index_system in range(nb_systems):
+        loop_system(
+            time_step,
+            nb_steps,
+            masses[index_system],
+            positions[index_system],
+            velocities[index_system],
+            energies[index_system],
+        )
+
+    return energies
+
+
+def make_rotated_copies(masses, positions, velocities, nb_systems, seed=0):
+    """Ensemble of randomly rotated copies of a system"""
+    rng = np.random.default_rng(seed)
+    # QR decompositions of random matrices give random orthogonal matrices
+    matrices, _ = np.linalg.qr(rng.standard_normal((nb_systems, 3, 3)))
+    return (
+        np.repeat(masses[np.newaxis], nb_systems, axis=0),
+        positions @ matrices,
+        velocities @ matrices,
+    )
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+
+    path_input = sys.argv[1]
+    try:
+        nb_systems = int(sys.argv[2])
+    except IndexError:
+        nb_systems = 256
+
+    try:
+        time_end = float(sys.argv[3])
+    except IndexError:
+        time_end = 1.0
+
+    time_step = 0.001
+    nb_steps = int(time_end / time_step)
+
+    masses, positions, velocities = make_rotated_copies(
+        *load_input_data(path_input), nb_systems
+    )
+    t_loop = perf_counter()
+    energies = loop(time_step, nb_steps, masses, positions, velocities)
+    duration_loop = perf_counter() - t_loop
+
+    errors = abs((energies[:, -1] - energies[:, 0]) / energies[:, 0])
+    print(
+        f"{nb_systems} systems of {masses.shape[1]} particles, "
+        f"{nb_steps} time steps"
+    )
+    print(
+        f"final |dE/E|: median = {np.median(errors):.3e}, "
+        f"max = {errors.max():.3e}"
+    )
+    print(
+        f"loop: {duration_loop:.3f} s "
+        f"({1e6 * duration_loop / (nb_systems * nb_steps):.2f} µs per "
+        "system and time step)"
+    )
+    print(f"total: {timedelta(seconds=perf_counter() - t_start)}")
@@ -0,0 +1,266 @@
+"""Leapfrog with the padded "aos4" layout (float4 particles)
+
+python bench_float4.py ../data/input1k 10 0
+
+The positions are stored in an (N, 4) array with the masses in the 4th column
+(see nbabel.input_data, layout="aos4"), so that the data of a particle used
+in the inner loops (x, y, z, m) is 32 bytes aligned and is loaded at once.
+The kernels are written with scalars (no temporary 3-vectors) so that gcc
+vectorizes the inner loops over the particles 1 (with -march=native -Ofast).
+
+Two kernels for the accelerations:
+
+- symmetric (default): the pairs are computed once (as in bench.py),
+- full_row: each row is a pure reduction over all the other particles (2 times
+  more pairs, but no writes in the inner loop).
+
+"""
+
+from math import sqrt
+from time import perf_counter
+from time import time as perf_time
+from datetime import timedelta
+
+import numpy as np
+
+from transonic import boost
+
+from nbabel.input_data import load_input_data, to_aos4
+from nbabel.timing import emit_durations
+
+
+def compute_accelerations(accelerations, positions):
+    nb_particules = positions.shape[0]
+    for index_p0 in range(nb_particules - 1):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        mass0 = positions[index_p0, 3]
+        ax = ay = az = 0.0
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            dx = x0 - positions[index_p1, 0]
+            dy = y0 - positions[index_p1, 1]
+            dz = z0 - positions[index_p1, 2]
+            distance2 = dx * dx + dy * dy + dz * dz
+            coef = 1.0 / (distance2 * sqrt(distance2))
+            coef1 = positions[index_p1, 3] * coef
+            ax -= coef1 * dx
+            ay -= coef1 * dy
+            az -= coef1 * dz
+            coef0 = mass0 * coef
+            accelerations[index_p1, 0] += coef0 * dx
+            accelerations[index_p1, 1] += coef0 * dy
+            accelerations[index_p1, 2] += coef0 * dz
+        accelerations[index_p0, 0] += ax
+        accelerations[index_p0, 1] += ay
+        accelerations[index_p0, 2] += az
+
+
+def compute_accelerations_full_row(accelerations, positions):
+    nb_particules = positions.shape[0]
+    for index_p0 in range(nb_particules):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        ax = ay = az = 0.0
+        for index_p1 in range(nb_particules):
+            dx = x0 - positions[index_p1, 0]
+            dy = y0 - positions[index_p1, 1]
+            dz = z0 - positions[index_p1, 2]
+            distance2 = dx * dx + dy * dy + dz * dz
+            # self-interaction (dx = dy = dz = 0)
+            if distance2 > 0:
+                coef = positions[index_p1, 3] / (distance2 * sqrt(distance2))
+            else:
+                coef = 0.0
+            ax -= coef * dx
+            ay -= coef * dy
+            az -= coef * dz
+        accelerations[index_p0, 0] = ax
+        accelerations[index_p0, 1] = ay
+        accelerations[index_p0, 2] = az
+
+
+def compute_kinetic_energy(positions, velocities):
+    energy = 0.0
+    for index_p in range(positions.shape[0]):
+        energy += positions[index_p, 3] * (
+            velocities[index_p, 0] ** 2
+            + velocities[index_p, 1] ** 2
+            + velocities[index_p, 2] ** 2
+        )
+    return 0.5 * energy
+
+
+def compute_potential_energy(positions):
+    nb_particules = positions.shape[0]
+    pe = 0.0
+    for index_p0 in range(nb_particules - 1):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        pe_row = 0.0
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            dx = x0 - positions[index_p1, 0]
+            dy = y0 - positions[index_p1, 1]
+            dz = z0 - positions[index_p1, 2]
+            distance = sqrt(dx * dx + dy * dy + dz * dz)
+            pe_row -= positions[index_p1, 3] / distance
+        pe += positions[index_p0, 3] * pe_row
+    return pe
+
+
+def compute_energy(positions, velocities):
+    return compute_kinetic_energy(
+        positions, velocities
+    ) + compute_potential_energy(positions)
+
+
+def accelerate(accelerations, positions, full_row):
+    if full_row:
+        compute_accelerations_full_row(accelerations, positions)
+    else:
+        accelerations.fill(0)
+        compute_accelerations(accelerations, positions)
+
+
+def advance_positions(positions, velocities, accelerations, time_step):
+    """Only x, y, z (the 4th column contains the masses)"""
+    nb_particules = positions.shape[0]
+    for index_p in range(nb_particules):
+        for i in range(3):
+            positions[index_p, i] += (
+                time_step * velocities[index_p, i]
+                + 0.5 * time_step ** 2 * accelerations[index_p, i]
+            )
+
+
+@boost
+def loop_aos4(
+    time_step: float,
+    nb_steps: int,
+    positions: "float[:,:]",
+    velocities: "float[:,:]",
+    full_row: bool = False,
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
+):
+    """positions: (N, 4) with the masses in the 4th column
+
+    Returns the energies and the durations of the phases. step_start > 0:
+    continuation of a simulation (see nbabel.engines).
+    """
+    accelerations = np.zeros_like(positions)
+    accelerations1 = np.zeros_like(positions)
+    accelerate(accelerations, positions, full_row)
+
+    if not step_start:
+        energy0 = compute_energy(positions, velocities)
+        energy_previous = energy0
+
+    perf_time_pos = 0.0
+    perf_time_swap = 0.0
+    perf_time_acc = 0.0
+    perf_time_vel = 0.0
+    perf_time_ener = 0.0
+
+    for step in range(step_start, step_start + nb_steps):
+        t0 = perf_time()
+        advance_positions(positions, velocities, accelerations, time_step)
+        t1 = perf_time()
+        perf_time_pos += t1 - t0
+        accelerations, accelerations1 = accelerations1, accelerations
+        t2 = perf_time()
+        perf_time_swap += t2 - t1
+        accelerate(accelerations, positions, full_row)
+        t3 = perf_time()
+        perf_time_acc += t3 - t2
+        # the 4th columns of the velocities and accelerations are 0
+        velocities += 0.5 * time_step * (accelerations + accelerations1)
+        t4 = perf_time()
+        perf_time_vel += t4 - t3
+
+        if not step % 100:
+            energy = compute_energy(positions, velocities)
+            print(
+                f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+            energy_previous = energy
+        perf_time_ener += perf_time() - t4
+
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    full_row=False,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """Same signature as the other engines ("aos3" arrays)
+
+    timing: print the times of the phases (JSON line, see nbabel.timing)
+    """
+    positions4, velocities4 = to_aos4(masses, positions, velocities)
+    energy, energy0, durations = loop_aos4(
+        time_step,
+        nb_steps,
+        positions4,
+        velocities4,
+        full_row,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+    positions[:] = positions4[:, :3]
+    velocities[:] = velocities4[:, :3]
+    if timing:
+        emit_durations("pythran-float4", masses.size, nb_steps, durations)
+    return energy, energy0
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        full_row = bool(int(sys.argv[3]))
+    except IndexError:
+        full_row = False
+
+    time_step = 0.001
+    nb_steps = int(time_end / time_step) + 1
+
+    path_input = sys.argv[1]
+    _, positions, velocities = load_input_data(path_input, layout="aos4")
+
+    energy, energy0, _ = loop_aos4(
+        time_step, nb_steps, positions, velocities, full_row
+    )
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
+    )
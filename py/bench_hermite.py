@@ -0,0 +1,269 @@
+"""4th order Hermite predictor-corrector scheme (Makino & Aarseth, 1992)
+
+python bench_hermite.py ../data/input1k 10 0.001
+
+The error decreases as time_step**4 (leapfrog: time_step**2), so larger time
+steps can be used for the same energy error (see compare_hermite_leapfrog.py).
+The accelerations and their time derivatives (jerks) are computed in one pass
+over the pairs. As for bench.py, the energy is computed and printed every 100
+time steps and the returned energy is the last one computed.
+
+"""
+
+from math import sqrt
+from time import perf_counter
+from time import time as perf_time
+from datetime import timedelta
+
+import numpy as np
+
+from transonic import boost
+
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
+
+
+def compute_accelerations_jerks(
+    accelerations, jerks, masses, positions, velocities
+):
+    nb_particules = masses.size
+    vector = np.empty(3)
+    vector_vel = np.empty(3)
+    for index_p0 in range(nb_particules - 1):
+        position0 = positions[index_p0]
+        velocity0 = velocities[index_p0]
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            for i in range(3):
+                vector[i] = position0[i] - positions[index_p1, i]
+                vector_vel[i] = velocity0[i] - velocities[index_p1, i]
+            distance2 = vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2
+            coef = 1.0 / (distance2 * sqrt(distance2))
+            coef_vel = (
+                3.0
+                * (
+                    vector[0] * vector_vel[0]
+                    + vector[1] * vector_vel[1]
+                    + vector[2] * vector_vel[2]
+                )
+                / distance2
+            )
+            for i in range(3):
+                accelerations[index_p0, i] -= coef * mass1 * vector[i]
+                accelerations[index_p1, i] += coef * mass0 * vector[i]
+                jerk = coef * (vector_vel[i] - coef_vel * vector[i])
+                jerks[index_p0, i] -= mass1 * jerk
+                jerks[index_p1, i] += mass0 * jerk
+
+
+def predict(
+    positions_pred,
+    velocities_pred,
+    positions,
+    velocities,
+    accelerations,
+    jerks,
+    time_step,
+):
+    positions_pred[:] = positions + time_step * (
+        velocities
+        + time_step * (0.5 * accelerations + time_step / 6 * jerks)
+    )
+    velocities_pred[:] = velocities + time_step * (
+        accelerations + 0.5 * time_step * jerks
+    )
+
+
+def correct(
+    positions,
+    velocities,
+    accelerations,
+    jerks,
+    accelerations1,
+    jerks1,
+    time_step,
+):
+    """Time symmetric form of the Hermite corrector"""
+    velocities_old = velocities.copy()
+    velocities += 0.5 * time_step * (accelerations + accelerations1) + (
+        time_step ** 2 / 12 * (jerks - jerks1)
+    )
+    positions += 0.5 * time_step * (velocities_old + velocities) + (
+        time_step ** 2 / 12 * (accelerations - accelerations1)
+    )
+
+
+@boost
+def loop_phases(
+    time_step: float,
+    nb_steps: int,
+    masses: "float[]",
+    positions: "float[:,:]",
+    velocities: "float[:,:]",
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
+):
+    """Time steps, returns the energies and the durations of the phases
+
+    The phases are predict ("pos"), swap, accelerations and jerks ("acc"),
+    correct ("vel") and energies. step_start > 0: continuation of a
+    simulation (see nbabel.engines).
+    """
+
+    accelerations = np.zeros_like(positions)
+    jerks = np.zeros_like(positions)
+    accelerations1 = np.zeros_like(positions)
+    jerks1 = np.zeros_like(positions)
+    positions_pred = np.empty_like(positions)
+    velocities_pred = np.empty_like(positions)
+
+    compute_accelerations_jerks(
+        accelerations, jerks, masses, positions, velocities
+    )
+
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, positions, velocities)
+        energy_previous = energy0
+
+    perf_time_pos = 0.0
+    perf_time_swap = 0.0
+    perf_time_acc = 0.0
+    perf_time_vel = 0.0
+    perf_time_ener = 0.0
+
+    for step in range(step_start, step_start + nb_steps):
+        t0 = perf_time()
+        predict(
+            positions_pred,
+            velocities_pred,
+            positions,
+            velocities,
+            accelerations,
+            jerks,
+            time_step,
+        )
+        t1 = perf_time()
+        perf_time_pos += t1 - t0
+        accelerations1.fill(0)
+        jerks1.fill(0)
+        t2 = perf_time()
+        perf_time_swap += t2 - t1
+        compute_accelerations_jerks(
+            accelerations1, jerks1, masses, positions_pred, velocities_pred
+        )
+        t3 = perf_time()
+        perf_time_acc += t3 - t2
+        correct(
+            positions,
+            velocities,
+            accelerations,
+            jerks,
+            accelerations1,
+            jerks1,
+            time_step,
+        )
+        # the forces at the predicted positions are used for the next step
+        # (PEC scheme, no second evaluation)
+        accelerations, accelerations1 = accelerations1, accelerations
+        jerks, jerks1 = jerks1, jerks
+        t4 = perf_time()
+        perf_time_vel += t4 - t3
+
+        if not step % 100:
+            energy, _, _ = compute_energies(masses, positions, velocities)
+            print(
+                f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+            energy_previous = energy
+        perf_time_ener += perf_time() - t4
+
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """timing: print the times of the phases (JSON line, see nbabel.timing)"""
+    energy, energy0, durations = loop_phases(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+    if timing:
+        emit_durations("hermite", masses.size, nb_steps, durations)
+    return energy, energy0
+
+
+def compute_kinetic_energy(masses, velocities):
+    return 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+
+
+def compute_potential_energy(masses, positions):
+    nb_particules = masses.size
+    pe = 0.0
+    for index_p0 in range(nb_particules - 1):
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            vector = positions[index_p0] - positions[index_p1]
+            distance = sqrt(sum(vector ** 2))
+            pe -= (mass0 * mass1) / distance
+    return pe
+
+
+def compute_energies(masses, positions, velocities):
+    energy_kin = compute_kinetic_energy(masses, velocities)
+    energy_pot = compute_potential_energy(masses, positions)
+    return energy_kin + energy_pot, energy_kin, energy_pot
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        time_step = float(sys.argv[3])
+    except IndexError:
+        time_step = 0.001
+
+    nb_steps = int(time_end / time_step) + 1
+
+    path_input = sys.argv[1]
+    masses, positions, velocities = load_input_data(path_input)
+
+    energy, energy0 = loop(time_step, nb_steps, masses, positions, velocities)
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
+    )
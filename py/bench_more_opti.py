@@ -4,22 +4,11 @@ from time import time as perf_time
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
 from transonic import boost
 
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
-
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
-
-    return masses, positions, velocities
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
 
 
 def advance_positions_old(positions, velocities, accelerations, time_step):
@@ -65,13 +54,14 @@ def compute_accelerations(accelerations, masses, positions):
 
 
 @boost
-def loop(
+def loop_phases(
     time_step: float,
     nb_steps: int,
     masses: "float[]",
     positions: "float[:,:]",
     velocities: "float[:,:]",
 ):
+    """Time steps, returns the energies and the durations of the phases"""
 
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
@@ -130,7 +120,25 @@ def loop(
         f"perf_time_vel:  {perf_time_vel:5.2f} s\n"
         f"perf_time_ener: {perf_time_ener:5.2f} s\n"
     )
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
 
+def loop(time_step, nb_steps, masses, positions, velocities, timing=False):
+    """timing: also print the times of the phases as a JSON line"""
+    energy, energy0, durations = loop_phases(
+        time_step, nb_steps, masses, positions, velocities
+    )
+    if timing:
+        emit_durations("pythran-more-opti", masses.size, nb_steps, durations)
     return energy, energy0
 
 
@@ -172,13 +180,20 @@ if __name__ == "__main__":
     except IndexError:
         time_end = 10.0
 
+    try:
+        timing = bool(int(sys.argv[3]))
+    except IndexError:
+        timing = False
+
     time_step = 0.001
     nb_steps = int(time_end / time_step) + 1
 
     path_input = sys.argv[1]
     masses, positions, velocities = load_input_data(path_input)
 
-    energy, energy0 = loop(time_step, nb_steps, masses, positions, velocities)
+    energy, energy0 = loop(
+        time_step, nb_steps, masses, positions, velocities, timing
+    )
     print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
     print(
         f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
@@ -0,0 +1,287 @@
+"""Accelerations computed by a pool of processes sharing memory
+
+python bench_multiprocessing.py ../data/input16k 0.01 4
+
+The masses, positions and accelerations live in a
+multiprocessing.shared_memory block. The workers compute disjoint blocks of
+rows with the "full row" method of compute_acc_alt.py (no write conflicts,
+2 times more pairs than the symmetric method), with Numba if it is installed
+and Numpy otherwise (kernel="", or kernel="numba" / "numpy" to choose). No
+OpenMP toolchain is needed.
+
+"""
+
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+from datetime import timedelta
+
+import numpy as np
+
+from nbabel import kernels as nbabel_kernels
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# number of rows per block for the Numpy kernel (memory ~ 72 * N bytes / row)
+block_size_numpy = 64
+
+
+def compute_accelerations_rows_numpy(
+    accelerations, masses, positions, start, stop
+):
+    for start_block in range(start, stop, block_size_numpy):
+        stop_block = min(start_block + block_size_numpy, stop)
+        vectors = (
+            positions[start_block:stop_block, np.newaxis, :]
+            - positions[np.newaxis, :, :]
+        )
+        distances2 = np.sum(vectors ** 2, 2)
+        # the self-interactions
+        distances2[
+            np.arange(stop_block - start_block),
+            np.arange(start_block, stop_block),
+        ] = np.inf
+        coefs = masses / (distances2 * np.sqrt(distances2))
+        accelerations[start_block:stop_block] = -np.einsum(
+            "ij,ijk->ik", coefs, vectors
+        )
+
+
+kernels = {
+    "numpy": (
+        compute_accelerations_rows_numpy,
+        nbabel_kernels.compute_potential_energy_rows_numpy,
+    )
+}
+if njit is not None:
+    jit = njit(cache=True, fastmath=True)
+    compute_accelerations_block = jit(
+        nbabel_kernels.compute_accelerations_block
+    )
+    compute_potential_energy_block = jit(
+        nbabel_kernels.compute_potential_energy_block
+    )
+
+    def compute_accelerations_rows_numba(
+        accelerations, masses, positions, start, stop
+    ):
+        accelerations[start:stop] = 0.0
+        compute_accelerations_block(
+            accelerations[start:stop],
+            positions[start:stop],
+            masses,
+            positions,
+            start,
+        )
+
+    def compute_potential_energy_rows_numba(masses, positions, start, stop):
+        # each pair is counted twice
+        return 0.5 * compute_potential_energy_block(
+            masses[start:stop], positions[start:stop], masses, positions, start
+        )
+
+    kernels["numba"] = (
+        compute_accelerations_rows_numba,
+        compute_potential_energy_rows_numba,
+    )
+
+
+class SharedArrays:
+    """Numpy views of a shared memory block
+
+    (masses, positions and accelerations)
+    """
+
+    def __init__(self, nb_particles, name=None):
+        size = 7 * nb_particles * 8
+        if name is None:
+            self.shared_memory = SharedMemory(create=True, size=size)
+        else:
+            self.shared_memory = SharedMemory(name=name)
+        self.name = self.shared_memory.name
+        data = np.ndarray(
+            7 * nb_particles, np.float64, self.shared_memory.buf
+        )
+        self.masses = data[:nb_particles]
+        self.positions = data[nb_particles : 4 * nb_particles].reshape(
+            nb_particles, 3
+        )
+        self.accelerations = data[4 * nb_particles :].reshape(nb_particles, 3)
+
+    def close(self):
+        # the views have to be deleted before closing the shared memory
+        del self.masses, self.positions, self.accelerations
+        self.shared_memory.close()
+
+
+# state of the worker processes
+_arrays = None
+_kernels = None
+
+
+def _init_worker(name, nb_particles, kernel):
+    global _arrays, _kernels
+    _arrays = SharedArrays(nb_particles, name)
+    _kernels = kernels[kernel]
+
+
+def _compute_accelerations(start_stop):
+    _kernels[0](
+        _arrays.accelerations, _arrays.masses, _arrays.positions, *start_stop
+    )
+
+
+def _compute_potential_energy(start_stop):
+    return _kernels[1](_arrays.masses, _arrays.positions, *start_stop)
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    nb_workers=0,
+    kernel="",
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """step_start > 0: continuation of a simulation (see nbabel.engines)"""
+    if not kernel:
+        kernel = "numba" if "numba" in kernels else "numpy"
+    if kernel not in kernels:
+        raise ValueError(
+            f"Kernel {kernel!r} not available (available: {list(kernels)})"
+        )
+    if nb_workers <= 0:
+        nb_workers = os.cpu_count()
+
+    nb_particles = masses.size
+    # 2 blocks of rows per worker
+    limits = np.linspace(0, nb_particles, 2 * nb_workers + 1).astype(int)
+    blocks = [
+        (int(start), int(stop)) for start, stop in zip(limits, limits[1:])
+    ]
+
+    timers = PhaseTimers(enabled=timing)
+    shared = SharedArrays(nb_particles)
+    try:
+        shared.masses[:] = masses
+        shared.positions[:] = positions
+        with Pool(
+            nb_workers,
+            initializer=_init_worker,
+            initargs=(shared.name, nb_particles, kernel),
+        ) as pool:
+            energy, energy0 = _loop(
+                pool,
+                blocks,
+                shared,
+                time_step,
+                nb_steps,
+                velocities,
+                timers,
+                step_start,
+                energy0,
+                energy_previous,
+            )
+        positions[:] = shared.positions
+    finally:
+        shared.close()
+        shared.shared_memory.unlink()
+    timers.emit("multiprocessing", nb_particles, nb_steps)
+    return energy, energy0
+
+
+def _loop(
+    pool,
+    blocks,
+    shared,
+    time_step,
+    nb_steps,
+    velocities,
+    timers,
+    step_start,
+    energy0,
+    energy_previous,
+):
+    masses = shared.masses
+    # the positions and accelerations are advanced in place in shared memory
+    positions = shared.positions
+    accelerations = shared.accelerations
+    accelerations1 = np.empty_like(accelerations)
+
+    def compute_energy():
+        energy_pot = sum(pool.map(_compute_potential_energy, blocks))
+        return 0.5 * np.sum(masses * np.sum(velocities ** 2, 1)) + energy_pot
+
+    pool.map(_compute_accelerations, blocks)
+    if not step_start:
+        energy0 = compute_energy()
+        energy_previous = energy0
+
+    for step in range(step_start, step_start + nb_steps):
+        with timers.phase("pos"):
+            positions += (
+                time_step * velocities + 0.5 * time_step ** 2 * accelerations
+            )
+        with timers.phase("swap"):
+            accelerations1[:] = accelerations
+        with timers.phase("acc"):
+            pool.map(_compute_accelerations, blocks)
+        with timers.phase("vel"):
+            velocities += 0.5 * time_step * (accelerations + accelerations1)
+
+        if not step % 100:
+            with timers.phase("ener"):
+                energy = compute_energy()
+            print(
+                f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+            energy_previous = energy
+
+    return energy, energy0
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        nb_workers = int(sys.argv[3])
+    except IndexError:
+        nb_workers = 0
+
+    try:
+        kernel = sys.argv[4]
+    except IndexError:
+        kernel = ""
+
+    time_step = 0.001
+    nb_steps = int(time_end / time_step) + 1
+
+    path_input = sys.argv[1]
+    masses, positions, velocities = load_input_data(path_input)
+
+    energy, energy0 = loop(
+        time_step, nb_steps, masses, positions, velocities, nb_workers, kernel
+    )
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
+    )
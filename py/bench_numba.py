@@ -3,24 +3,16 @@ from time import perf_counter
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
-from numba import njit
-
-jit = njit(cache=True, fastmath=True)
+from numba import njit, objmode, prange, get_num_threads
 
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers
 
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
-
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
+jit = njit(cache=True, fastmath=True)
+jit_parallel = njit(cache=True, fastmath=True, parallel=True)
 
-    return masses, positions, velocities
+phases = ("pos", "swap", "acc", "vel", "ener")
 
 
 @jit
@@ -72,6 +64,56 @@ def compute_accelerations(accelerations, masses, positions):
                 acceleration1[i] += coef_m0 * vector[i]
 
 
+@jit_parallel
+def compute_accelerations_parallel(accelerations, masses, positions):
+    """Parallel version of compute_accelerations ("full row" method)
+
+    The rows are distributed over the threads and each row is computed with
+    all the other particles, so that each thread only writes its rows (no
+    per-thread copies of the accelerations, 2 times more pairs than the
+    symmetric method).
+    """
+    nb_particules = masses.size
+    for index_p0 in prange(nb_particules):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        ax = ay = az = 0.0
+        for index_p1 in range(nb_particules):
+            if index_p1 == index_p0:
+                continue
+            dx = x0 - positions[index_p1, 0]
+            dy = y0 - positions[index_p1, 1]
+            dz = z0 - positions[index_p1, 2]
+            distance2 = dx ** 2 + dy ** 2 + dz ** 2
+            coef_m1 = masses[index_p1] / (distance2 * sqrt(distance2))
+            ax -= coef_m1 * dx
+            ay -= coef_m1 * dy
+            az -= coef_m1 * dz
+        accelerations[index_p0, 0] = ax
+        accelerations[index_p0, 1] = ay
+        accelerations[index_p0, 2] = az
+
+
+@jit
+def clock(timing):
+    """perf_counter (object mode) if timing, else 0"""
+    if not timing:
+        return 0.0
+    with objmode(time="float64"):
+        time = perf_counter()
+    return time
+
+
+def emit_timing(nb_threads, nb_particles, nb_steps, perf_times):
+    """JSON line of nbabel.timing (called in object mode)"""
+    timers = PhaseTimers()
+    for name, duration in zip(phases, perf_times):
+        timers.add(name, duration)
+    engine = "numba-parallel" if nb_threads > 0 else "numba"
+    timers.emit(engine, nb_particles, nb_steps)
+
+
 @jit
 def loop(
     time_step: float,
@@ -79,27 +121,65 @@ def loop(
     masses: "float[:]",
     positions: "float[:,:]",
     velocities: "float[:,:]",
+    nb_threads: int = 0,
+    timing: bool = False,
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
 ):
+    """nb_threads > 0: parallel kernels (number of threads used by Numba:
+    NUMBA_NUM_THREADS), nb_threads = 0: sequential kernels
+
+    timing: print the times of the phases (JSON line, see nbabel.timing)
+
+    step_start > 0: continuation of a simulation (see nbabel.engines)
+    """
+    parallel = nb_threads > 0
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
 
-    compute_accelerations(accelerations, masses, positions)
+    if parallel:
+        compute_accelerations_parallel(accelerations, masses, positions)
+    else:
+        compute_accelerations(accelerations, masses, positions)
 
     time = 0.0
-    energy0, _, _ = compute_energies(masses, positions, velocities)
-    energy_previous = energy0
+    if not step_start:
+        energy0, _, _ = compute_energies(
+            masses, positions, velocities, parallel
+        )
+        energy_previous = energy0
 
-    for step in range(nb_steps):
+    # durations of the phases (pos, swap, acc, vel, ener)
+    perf_times = np.zeros(len(phases))
+
+    for step in range(step_start, step_start + nb_steps):
+        t0 = clock(timing)
         advance_positions(positions, velocities, accelerations, time_step)
+        t1 = clock(timing)
+        perf_times[0] += t1 - t0
         # swap acceleration arrays
         accelerations, accelerations1 = accelerations1, accelerations
-        accelerations.fill(0)
-        compute_accelerations(accelerations, masses, positions)
-        advance_velocities(velocities, accelerations, accelerations1, time_step)
+        t2 = clock(timing)
+        perf_times[1] += t2 - t1
+        if parallel:
+            compute_accelerations_parallel(accelerations, masses, positions)
+        else:
+            accelerations.fill(0)
+            compute_accelerations(accelerations, masses, positions)
+        t3 = clock(timing)
+        perf_times[2] += t3 - t2
+        advance_velocities(
+            velocities, accelerations, accelerations1, time_step
+        )
+        t4 = clock(timing)
+        perf_times[3] += t4 - t3
         time += time_step
 
         if not step % 100:
-            energy, _, _ = compute_energies(masses, positions, velocities)
+            energy, _, _ = compute_energies(
+                masses, positions, velocities, parallel
+            )
             # Numba doesn't support string formatting!
             print(
                 "t =",
@@ -110,10 +190,43 @@ def loop(
                 (energy - energy_previous) / energy_previous,
             )
             energy_previous = energy
+        perf_times[4] += clock(timing) - t4
+
+    if timing:
+        with objmode():
+            emit_timing(nb_threads, masses.size, nb_steps, perf_times)
 
     return energy, energy0
 
 
+def loop_parallel(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """Parallel version of loop (number of threads: NUMBA_NUM_THREADS)"""
+    # get_num_threads is called here because, called in a jitted function,
+    # it prevents the caching of the compiled function
+    return loop(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        get_num_threads(),
+        timing,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+
+
 @jit
 def compute_kinetic_energy(masses, velocities):
     return 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
@@ -133,10 +246,30 @@ def compute_potential_energy(masses, positions):
     return pe
 
 
+@jit_parallel
+def compute_potential_energy_parallel(masses, positions):
+    nb_particules = masses.size
+    pe = 0.0
+    # scalar reduction supported by prange
+    for index_p0 in prange(nb_particules - 1):
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            distance = sqrt(
+                (positions[index_p0, 0] - positions[index_p1, 0]) ** 2
+                + (positions[index_p0, 1] - positions[index_p1, 1]) ** 2
+                + (positions[index_p0, 2] - positions[index_p1, 2]) ** 2
+            )
+            pe -= (mass0 * masses[index_p1]) / distance
+    return pe
+
+
 @jit
-def compute_energies(masses, positions, velocities):
+def compute_energies(masses, positions, velocities, parallel=False):
     energy_kin = compute_kinetic_energy(masses, velocities)
-    energy_pot = compute_potential_energy(masses, positions)
+    if parallel:
+        energy_pot = compute_potential_energy_parallel(masses, positions)
+    else:
+        energy_pot = compute_potential_energy(masses, positions)
     return energy_kin + energy_pot, energy_kin, energy_pot
 
 
@@ -150,6 +283,13 @@ if __name__ == "__main__":
     except IndexError:
         time_end = 10.0
 
+    try:
+        # number of threads: NUMBA_NUM_THREADS
+        parallel = bool(int(sys.argv[3]))
+    except IndexError:
+        parallel = False
+    nb_threads = get_num_threads() if parallel else 0
+
     time_step = 0.001
 
     nb_steps = int(time_end / time_step) + 1
@@ -157,7 +297,9 @@ if __name__ == "__main__":
     path_input = sys.argv[1]
     masses, positions, velocities = load_input_data(path_input)
 
-    energy, energy0 = loop(time_step, nb_steps, masses, positions, velocities)
+    energy, energy0 = loop(
+        time_step, nb_steps, masses, positions, velocities, nb_threads
+    )
     print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
     print(
         f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
@@ -3,18 +3,9 @@ from time import perf_counter
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
-    return masses, positions, velocities
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers
 
 
 def advance_positions(positions, velocities, accelerations, time_step):
@@ -39,33 +30,54 @@ def compute_accelerations(accelerations, masses, positions):
             accelerations[index_p1] += coef * mass0 * vector
 
 
-def loop(time_step, nb_steps, masses, positions, velocities):
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """step_start > 0: continuation of a simulation (see nbabel.engines)"""
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
 
     compute_accelerations(accelerations, masses, positions)
 
     time = 0.0
-    energy0, _, _ = compute_energies(masses, positions, velocities)
-    energy_previous = energy0
-
-    for step in range(nb_steps):
-        advance_positions(positions, velocities, accelerations, time_step)
-        # swap acceleration arrays
-        accelerations, accelerations1 = accelerations1, accelerations
-        accelerations.fill(0)
-        compute_accelerations(accelerations, masses, positions)
-        advance_velocities(velocities, accelerations, accelerations1, time_step)
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, positions, velocities)
+        energy_previous = energy0
+
+    timers = PhaseTimers(enabled=timing)
+    for step in range(step_start, step_start + nb_steps):
+        with timers.phase("pos"):
+            advance_positions(positions, velocities, accelerations, time_step)
+        with timers.phase("swap"):
+            # swap acceleration arrays
+            accelerations, accelerations1 = accelerations1, accelerations
+            accelerations.fill(0)
+        with timers.phase("acc"):
+            compute_accelerations(accelerations, masses, positions)
+        with timers.phase("vel"):
+            advance_velocities(
+                velocities, accelerations, accelerations1, time_step
+            )
         time += time_step
 
         if not step % 100:
-            energy, _, _ = compute_energies(masses, positions, velocities)
+            with timers.phase("ener"):
+                energy, _, _ = compute_energies(masses, positions, velocities)
             print(
                 f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
                 f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
             )
             energy_previous = energy
 
+    timers.emit("numpy", masses.size, nb_steps)
     return energy, energy0
 
 
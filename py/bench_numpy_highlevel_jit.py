@@ -1,22 +1,14 @@
 from math import sqrt
 from time import perf_counter
+from time import time as perf_time
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
 from transonic import jit
 
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
-    return masses, positions, velocities
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
 
 
 def advance_positions(positions, velocities, accelerations, time_step):
@@ -42,7 +34,8 @@ def compute_accelerations(accelerations, masses, positions):
 
 
 @jit
-def loop(time_step, nb_steps, masses, positions, velocities):
+def loop_phases(time_step, nb_steps, masses, positions, velocities):
+    """Time steps, returns the energies and the durations of the phases"""
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
 
@@ -52,13 +45,28 @@ def loop(time_step, nb_steps, masses, positions, velocities):
     energy0, _, _ = compute_energies(masses, positions, velocities)
     energy_previous = energy0
 
+    perf_time_pos = 0.0
+    perf_time_swap = 0.0
+    perf_time_acc = 0.0
+    perf_time_vel = 0.0
+    perf_time_ener = 0.0
+
     for step in range(nb_steps):
+        t0 = perf_time()
         advance_positions(positions, velocities, accelerations, time_step)
+        t1 = perf_time()
+        perf_time_pos += t1 - t0
         # swap acceleration arrays
         accelerations, accelerations1 = accelerations1, accelerations
         accelerations.fill(0)
+        t2 = perf_time()
+        perf_time_swap += t2 - t1
         compute_accelerations(accelerations, masses, positions)
+        t3 = perf_time()
+        perf_time_acc += t3 - t2
         advance_velocities(velocities, accelerations, accelerations1, time_step)
+        t4 = perf_time()
+        perf_time_vel += t4 - t3
         time += time_step
 
         if not step % 100:
@@ -68,7 +76,27 @@ def loop(time_step, nb_steps, masses, positions, velocities):
                 f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
             )
             energy_previous = energy
+        perf_time_ener += perf_time() - t4
+
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
+
 
+def loop(time_step, nb_steps, masses, positions, velocities, timing=False):
+    """timing: print the times of the phases (JSON line, see nbabel.timing)"""
+    energy, energy0, durations = loop_phases(
+        time_step, nb_steps, masses, positions, velocities
+    )
+    if timing:
+        emit_durations("numpy-jit", masses.size, nb_steps, durations)
     return energy, energy0
 
 
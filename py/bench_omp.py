@@ -4,27 +4,16 @@ from time import time as perf_time
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
 # pythran specific omp module
 import omp
 
 from transonic import boost
 
-dim = 3
-
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers, emit_durations
 
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
-
-    return masses, positions, velocities
+dim = 3
 
 
 def advance_positions(positions, velocities, accelerations, time_step):
@@ -79,6 +68,116 @@ def compute_accelerations(accelerations, masses, positions):
                 accelerations[0, i_part, i] += accelerations[i_thread, i_part, i]
 
 
+def compute_accelerations_energy(accelerations, masses, positions):
+    """compute_accelerations fused with compute_potential_energy"""
+    nb_particules = masses.size
+    nthreads = accelerations.shape[0]
+    pe = 0.0
+
+    # omp parallel for schedule(static,8) reduction(+:pe)
+    for index_p0 in range(nb_particules - 1):
+        vector = np.empty(dim)
+        rank = omp.get_thread_num()
+        position0 = positions[index_p0]
+        mass0 = masses[index_p0]
+        for index_p1 in range(index_p0 + 1, nb_particules):
+            mass1 = masses[index_p1]
+            for i in range(dim):
+                vector[i] = position0[i] - positions[index_p1, i]
+            distance = sqrt(sum(vector ** 2))
+            coef = 1.0 / distance ** 3
+            for i in range(dim):
+                accelerations[rank, index_p0, i] -= coef * mass1 * vector[i]
+                accelerations[rank, index_p1, i] += coef * mass0 * vector[i]
+            pe -= (mass0 * mass1) / distance
+
+    # omp parallel for
+    for i_part in range(nb_particules):
+        for i_thread in range(1, nthreads):
+            for i in range(dim):
+                accelerations[0, i_part, i] += accelerations[i_thread, i_part, i]
+
+    return pe
+
+
+def compute_accelerations_full_row(accelerations, masses, positions):
+    """
+    Each particle computes its full row of interactions (twice more pair
+    evaluations but no race condition, so only one acceleration array is
+    needed whatever the number of threads). See compute_acc_alt.py.
+    """
+    nb_particules = masses.size
+
+    # omp parallel for schedule(static,8)
+    for index_p0 in range(nb_particules):
+        vector = np.empty(dim)
+        acceleration = np.zeros(dim)
+        position0 = positions[index_p0]
+        for index_p1 in range(nb_particules):
+            if index_p1 == index_p0:
+                continue
+            for i in range(dim):
+                vector[i] = position0[i] - positions[index_p1, i]
+            distance = sqrt(sum(vector ** 2))
+            coef = masses[index_p1] / distance ** 3
+            for i in range(dim):
+                acceleration[i] -= coef * vector[i]
+        for i in range(dim):
+            accelerations[0, index_p0, i] = acceleration[i]
+
+
+def compute_accelerations_full_row_energy(accelerations, masses, positions):
+    """compute_accelerations_full_row fused with compute_potential_energy"""
+    nb_particules = masses.size
+    pe = 0.0
+
+    # omp parallel for schedule(static,8) reduction(+:pe)
+    for index_p0 in range(nb_particules):
+        vector = np.empty(dim)
+        acceleration = np.zeros(dim)
+        position0 = positions[index_p0]
+        mass0 = masses[index_p0]
+        for index_p1 in range(nb_particules):
+            if index_p1 == index_p0:
+                continue
+            mass1 = masses[index_p1]
+            for i in range(dim):
+                vector[i] = position0[i] - positions[index_p1, i]
+            distance = sqrt(sum(vector ** 2))
+            coef = mass1 / distance ** 3
+            for i in range(dim):
+                acceleration[i] -= coef * vector[i]
+            # each pair is seen twice
+            pe -= 0.5 * (mass0 * mass1) / distance
+        for i in range(dim):
+            accelerations[0, index_p0, i] = acceleration[i]
+
+    return pe
+
+
+@boost
+def accelerate(
+    accelerations: "float[:,:,:]",
+    masses: "float[]",
+    positions: "float[:,:]",
+    full_row: bool,
+):
+    if full_row:
+        compute_accelerations_full_row(accelerations, masses, positions)
+    else:
+        compute_accelerations(accelerations, masses, positions)
+
+
+def accelerate_energy(accelerations, masses, positions, full_row):
+    if full_row:
+        return compute_accelerations_full_row_energy(
+            accelerations, masses, positions
+        )
+    else:
+        return compute_accelerations_energy(accelerations, masses, positions)
+
+
+@boost
 def get_num_threads():
     nthreads = -1
     # omp parallel
@@ -89,25 +188,41 @@ def get_num_threads():
 
 
 @boost
-def loop(
+def loop_phases(
     time_step: float,
     nb_steps: int,
     masses: "float[]",
     positions: "float[:,:]",
     velocities: "float[:,:]",
+    fuse_energy: bool = False,
+    full_row: bool = False,
+    step_start: int = 0,
+    energy0: float = 0.0,
+    energy_previous: float = 0.0,
 ):
+    """Time steps, returns the energies and the durations of the phases
+
+    step_start > 0: continuation of a simulation (see nbabel.engines)
+    """
 
-    nthreads = get_num_threads()
     nb_parts, dim = positions.shape
 
-    accelerations = np.zeros([nthreads, nb_parts, dim])
+    if full_row:
+        # no per-thread copies of the accelerations
+        nb_copies = 1
+    else:
+        nb_copies = get_num_threads()
+
+    accelerations = np.zeros([nb_copies, nb_parts, dim])
     accelerations1 = np.zeros_like(accelerations)
 
-    compute_accelerations(accelerations, masses, positions)
+    accelerate(accelerations, masses, positions, full_row)
 
     time = 0.0
-    energy0, _, _ = compute_energies(masses, positions, velocities)
-    energy_previous = energy0
+    if not step_start:
+        energy0, _, _ = compute_energies(masses, positions, velocities)
+        energy_previous = energy0
+    energy_pot = 0.0
 
     perf_time_pos = 0.0
     perf_time_acc = 0.0
@@ -115,7 +230,7 @@ def loop(
     perf_time_swap = 0.0
     perf_time_ener = 0.0
 
-    for step in range(nb_steps):
+    for step in range(step_start, step_start + nb_steps):
 
         t0 = perf_time()
         advance_positions(positions, velocities, accelerations[0], time_step)
@@ -128,7 +243,13 @@ def loop(
         t2 = perf_time()
         perf_time_swap += t2 - t1
 
-        compute_accelerations(accelerations, masses, positions)
+        if fuse_energy and not step % 100:
+            # the potential energy is computed during the acceleration pass
+            energy_pot = accelerate_energy(
+                accelerations, masses, positions, full_row
+            )
+        else:
+            accelerate(accelerations, masses, positions, full_row)
         t3 = perf_time()
         perf_time_acc += t3 - t2
 
@@ -141,7 +262,10 @@ def loop(
         time += time_step
 
         if not step % 100:
-            energy, _, _ = compute_energies(masses, positions, velocities)
+            if fuse_energy:
+                energy = compute_kinetic_energy(masses, velocities) + energy_pot
+            else:
+                energy, _, _ = compute_energies(masses, positions, velocities)
             # f-strings supported by Pythran>=0.9.8
             print(
                 f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
@@ -159,10 +283,162 @@ def loop(
         f"perf_time_vel:  {perf_time_vel:5.2f} s\n"
         f"perf_time_ener: {perf_time_ener:5.2f} s\n"
     )
+    durations = np.array(
+        [
+            perf_time_pos,
+            perf_time_swap,
+            perf_time_acc,
+            perf_time_vel,
+            perf_time_ener,
+        ]
+    )
+    return energy, energy0, durations
 
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    fuse_energy=False,
+    full_row=False,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """timing: also print the times of the phases as a JSON line"""
+    energy, energy0, durations = loop_phases(
+        time_step,
+        nb_steps,
+        masses,
+        positions,
+        velocities,
+        fuse_energy,
+        full_row,
+        step_start,
+        energy0,
+        energy_previous,
+    )
+    if timing:
+        emit_durations("pythran-omp", masses.size, nb_steps, durations)
     return energy, energy0
 
 
+@boost
+def advance(
+    time_step: float,
+    nb_steps: int,
+    masses: "float[]",
+    positions: "float[:,:]",
+    velocities: "float[:,:]",
+    accelerations: "float[:,:,:]",
+    accelerations1: "float[:,:,:]",
+    full_row: bool,
+):
+    """Time steps without energy computation
+
+    accelerations[0] has to contain the accelerations for the positions (it
+    is updated, so that the next call continues exactly as `loop`).
+    """
+    for _ in range(nb_steps):
+        advance_positions(positions, velocities, accelerations[0], time_step)
+        # no swap: the arrays are owned by the caller
+        accelerations1[0] = accelerations[0]
+        accelerations.fill(0)
+        accelerate(accelerations, masses, positions, full_row)
+        advance_velocities(
+            velocities, accelerations[0], accelerations1[0], time_step
+        )
+
+
+def loop_async_energy(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    full_row=False,
+    path_log="",
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """Same time steps as `loop` but the energies are computed in a thread
+
+    The state is copied every 100 steps (after the same steps as in `loop`)
+    and the energies are computed by nbabel.diagnostics.EnergyDiagnostics.
+    A diagnostic is skipped if the previous ones are not finished (except
+    the last one), so the time stepping never waits for the energies.
+
+    step_start > 0: continuation of a simulation (see nbabel.engines), the
+    lines are appended to the log file.
+    """
+    # imported here because nbabel.diagnostics imports Numba
+    from nbabel.diagnostics import EnergyDiagnostics
+
+    nb_parts, dim = positions.shape
+    nb_copies = 1 if full_row else get_num_threads()
+    accelerations = np.zeros([nb_copies, nb_parts, dim])
+    accelerations1 = np.zeros_like(accelerations)
+    accelerate(accelerations, masses, positions, full_row)
+
+    # phases: step (positions, accelerations, velocities), ener (copies of
+    # the state) and wait (end of the diagnostics)
+    timers = PhaseTimers()
+    if step_start:
+        diagnostics = EnergyDiagnostics(
+            masses, time_step, path_log, energy_previous=energy_previous
+        )
+    else:
+        diagnostics = EnergyDiagnostics(masses, time_step, path_log)
+        with timers.phase("ener"):
+            diagnostics.submit(0, positions, velocities)
+    step_stop = step_start + nb_steps
+    try:
+        # as in loop: energies after the steps 1, 101, 201, ...
+        step = step_start
+        while step < step_stop:
+            step_next = min(step + (100 if step % 100 else 1), step_stop)
+            with timers.phase("step"):
+                advance(
+                    time_step,
+                    step_next - step,
+                    masses,
+                    positions,
+                    velocities,
+                    accelerations,
+                    accelerations1,
+                    full_row,
+                )
+            if (step_next - 1) % 100 == 0:
+                # the last diagnostic is never skipped
+                last = step_next + 100 > step_stop
+                with timers.phase("ener"):
+                    diagnostics.submit(
+                        step_next, positions, velocities, block=last
+                    )
+            step = step_next
+    finally:
+        with timers.phase("wait"):
+            diagnostics.close()
+
+    durations = timers.durations
+    print(
+        f"perf_time_step: {durations['step']:5.2f} s\n"
+        f"perf_time_ener: {durations['ener']:5.2f} s\n"
+        f"perf_time_wait: {durations['wait']:5.2f} s\n"
+        f"diagnostics skipped: {diagnostics.nb_skipped}\n"
+    )
+    if timing:
+        timers.emit("pythran-omp-async", nb_parts, nb_steps)
+    if not step_start:
+        energy0 = diagnostics.energy0
+    return diagnostics.energy, energy0
+
+
 def compute_kinetic_energy(masses, velocities):
     return 0.5 * sum(masses * np.sum(velocities ** 2, 1))
 
@@ -199,13 +475,41 @@ if __name__ == "__main__":
     except IndexError:
         time_end = 10.0
 
+    try:
+        fuse_energy = bool(int(sys.argv[3]))
+    except IndexError:
+        fuse_energy = False
+
+    try:
+        full_row = bool(int(sys.argv[4]))
+    except IndexError:
+        full_row = False
+
+    try:
+        async_energy = bool(int(sys.argv[5]))
+    except IndexError:
+        async_energy = False
+
     time_step = 0.001
     nb_steps = int(time_end / time_step) + 1
 
     path_input = sys.argv[1]
     masses, positions, velocities = load_input_data(path_input)
 
-    energy, energy0 = loop(time_step, nb_steps, masses, positions, velocities)
+    if async_energy:
+        energy, energy0 = loop_async_energy(
+            time_step, nb_steps, masses, positions, velocities, full_row
+        )
+    else:
+        energy, energy0 = loop(
+            time_step,
+            nb_steps,
+            masses,
+            positions,
+            velocities,
+            fuse_energy,
+            full_row,
+        )
     print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
     print(
         f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
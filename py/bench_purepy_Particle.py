@@ -4,6 +4,9 @@ from math import sqrt
 from time import perf_counter
 from datetime import timedelta
 
+from nbabel.parser import iter_rows
+from nbabel.timing import PhaseTimers
+
 
 class Point3D:
     def __init__(self, x, y, z):
@@ -135,6 +138,61 @@ class Cluster(list):
             p.velocity += 0.5 * dt * (p.acceleration + p.acceleration1)
 
 
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """Same interface as the other implementations (used by nbabel.engines)
+
+    positions and velocities (sequences of 3 floats) are updated in place.
+    With timing=True, the times of the phases "step" and "ener" are printed
+    (JSON line, see nbabel.timing). step_start > 0: continuation of a
+    simulation (see nbabel.engines).
+    """
+    timers = PhaseTimers(enabled=timing)
+    cluster = Cluster(
+        Particle(mass, *position, *velocity)
+        for mass, position, velocity in zip(masses, positions, velocities)
+    )
+    cluster.accelerate()
+    if not step_start:
+        energy0 = energy_previous = cluster.energy
+    energy = energy_previous
+    for step in range(step_start, step_start + nb_steps):
+        with timers.phase("step"):
+            cluster.step(time_step)
+        if not step % 100:
+            with timers.phase("ener"):
+                energy = cluster.energy
+            print(
+                f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+            energy_previous = energy
+
+    for particle, position, velocity in zip(cluster, positions, velocities):
+        position[0], position[1], position[2] = (
+            particle._position_x,
+            particle._position_y,
+            particle._position_z,
+        )
+        velocity[0], velocity[1], velocity[2] = (
+            particle._velocity_x,
+            particle._velocity_y,
+            particle._velocity_z,
+        )
+
+    timers.emit("purepy", len(cluster), nb_steps)
+    return energy, energy0
+
+
 if __name__ == "__main__":
 
     t_start = perf_counter()
@@ -145,13 +203,7 @@ if __name__ == "__main__":
         time_end = 10.
 
     time_step = 0.001
-    cluster = Cluster()
-    with open(sys.argv[1]) as input_file:
-        for line in input_file:
-            try:
-                cluster.append(Particle(*[float(x) for x in line.split()[1:]]))
-            except TypeError:
-                pass
+    cluster = Cluster(Particle(*row) for row in iter_rows(sys.argv[1]))
 
     old_energy = energy0 = energy = -0.25
     cluster.accelerate()
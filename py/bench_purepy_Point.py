@@ -3,6 +3,7 @@ from time import perf_counter
 from datetime import timedelta
 
 from vector import Vector
+from nbabel.parser import iter_rows
 
 
 class Point:
@@ -63,15 +64,10 @@ def load_input_data(path):
     positions_tuples = []
     velocities_tuples = []
 
-    with open(path) as input_file:
-        for line in input_file:
-            if not line.strip():
-                continue
-
-            mass, x, y, z, vx, vy, vz = [float(x) for x in line.split()[1:]]
-            masses.append(mass)
-            positions_tuples.append((x, y, z))
-            velocities_tuples.append((vx, vy, vz))
+    for mass, x, y, z, vx, vy, vz in iter_rows(path):
+        masses.append(mass)
+        positions_tuples.append((x, y, z))
+        velocities_tuples.append((vx, vy, vz))
 
     number_particles = len(masses)
 
@@ -0,0 +1,294 @@
+"""Ring (systolic) decomposition over processes
+
+python bench_ring.py ../data/input16k 0.01 4 pipe
+
+Each rank owns a contiguous slice of the particles. For each evaluation of
+the accelerations, the blocks of particles (masses and positions) are passed
+around the ring: at each of the nb_ranks shifts, a rank computes the
+accelerations of its particles due to the visiting block while the block is
+sent to the next rank and the next one is received from the previous rank.
+
+The kernels are the block kernels of nbabel.kernels (shared with
+bench_multiprocessing.py). The symmetric compute_accelerations kernel
+(each pair visited once) cannot be used: the accelerations of the visiting
+block belong to another rank and would have to travel with the block.
+
+The ranks communicate through a transport (nbabel.transport): pipes (one
+machine) or sockets (can be used between machines). Here, all ranks are
+started as local processes.
+
+"""
+
+import os
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from socket import socket
+from time import perf_counter
+from datetime import timedelta
+
+import numpy as np
+
+from numba import njit
+
+from nbabel import kernels
+from nbabel.input_data import load_input_data
+from nbabel.timing import PhaseTimers
+from nbabel.transport import create_pipe_transports, create_socket_transport
+
+# nogil: the computation overlaps the communication (threads of the transport)
+jit = njit(cache=True, fastmath=True, nogil=True)
+
+compute_accelerations_block = jit(kernels.compute_accelerations_block)
+compute_potential_energy_block = jit(kernels.compute_potential_energy_block)
+
+
+class Rank:
+    def __init__(self, rank, limits, transport, masses, positions):
+        self.rank = rank
+        self.nb_ranks = len(limits) - 1
+        self.limits = limits
+        self.transport = transport
+        self.start = limits[rank]
+        size_max = max(np.diff(limits))
+        # rows (mass, x, y, z) of the local particles
+        self.block = np.empty((masses.size, 4))
+        self.block[:, 0] = masses
+        self.block[:, 1:] = positions
+        self.buffers = [np.empty((size_max, 4)), np.empty((size_max, 4))]
+
+    def ring_pass(self, accelerations, with_energy=False):
+        """Compute the accelerations (and the potential energy of the system)
+
+        The positions of the local block have to be up to date.
+        """
+        accelerations.fill(0)
+        energy = 0.0
+        block = self.block
+        masses0 = self.block[:, 0]
+        positions0 = self.block[:, 1:]
+        for shift in range(self.nb_ranks):
+            if shift < self.nb_ranks - 1:
+                buffer_recv = self.buffers[shift % 2]
+                wait = self.transport.start_shift(block, buffer_recv)
+            rank_block = (self.rank - shift) % self.nb_ranks
+            offset = self.start - self.limits[rank_block]
+            compute_accelerations_block(
+                accelerations, positions0, block[:, 0], block[:, 1:], offset
+            )
+            if with_energy:
+                energy += compute_potential_energy_block(
+                    masses0, positions0, block[:, 0], block[:, 1:], offset
+                )
+            if shift < self.nb_ranks - 1:
+                nb_rows = wait() // 4
+                block = buffer_recv[:nb_rows]
+        if with_energy:
+            # each pair is counted twice (by the 2 ranks or in the local block)
+            return self.transport.allreduce_sum(0.5 * energy, self.nb_ranks)
+
+    def compute_energy(self, velocities, energy_pot):
+        masses = self.block[:, 0]
+        energy_kin = 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+        return energy_pot + self.transport.allreduce_sum(
+            energy_kin, self.nb_ranks
+        )
+
+
+def run_rank(
+    rank,
+    limits,
+    transport,
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    connection_result,
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    if not hasattr(transport, "start_shift"):
+        # socket addresses: the transport is created in the rank
+        transport = create_socket_transport(rank, transport)
+
+    worker = Rank(rank, limits, transport, masses, positions)
+    positions = worker.block[:, 1:]
+    accelerations = np.empty_like(positions)
+    accelerations1 = np.empty_like(positions)
+
+    if step_start:
+        worker.ring_pass(accelerations)
+    else:
+        energy_pot = worker.ring_pass(accelerations, with_energy=True)
+        energy0 = worker.compute_energy(velocities, energy_pot)
+        energy_previous = energy0
+
+    # phases of the rank 0 ("acc" includes the communications and, every
+    # 100 steps, the potential energy)
+    timers = PhaseTimers(enabled=timing and rank == 0)
+    for step in range(step_start, step_start + nb_steps):
+        with timers.phase("pos"):
+            positions += (
+                time_step * velocities + 0.5 * time_step ** 2 * accelerations
+            )
+        with timers.phase("swap"):
+            accelerations, accelerations1 = accelerations1, accelerations
+        with_energy = not step % 100
+        with timers.phase("acc"):
+            energy_pot = worker.ring_pass(accelerations, with_energy)
+        with timers.phase("vel"):
+            velocities += 0.5 * time_step * (accelerations + accelerations1)
+
+        if with_energy:
+            with timers.phase("ener"):
+                energy = worker.compute_energy(velocities, energy_pot)
+            if rank == 0:
+                delta = (energy - energy_previous) / energy_previous
+                print(
+                    f"t = {time_step * step:5.2f}, E = {energy:.10f}, "
+                    f"dE/E = {delta:+.10f}",
+                    flush=True,
+                )
+            energy_previous = energy
+
+    timers.emit("ring", int(limits[-1]), nb_steps)
+    connection_result.send((positions.copy(), velocities, energy, energy0))
+    transport.close()
+
+
+def get_free_port():
+    with socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def loop(
+    time_step,
+    nb_steps,
+    masses,
+    positions,
+    velocities,
+    nb_ranks=0,
+    transport="pipe",
+    timing=False,
+    step_start=0,
+    energy0=0.0,
+    energy_previous=0.0,
+):
+    """step_start > 0: continuation of a simulation (see nbabel.engines)"""
+    if nb_ranks <= 0:
+        nb_ranks = os.cpu_count()
+    limits = np.linspace(0, masses.size, nb_ranks + 1).astype(int)
+
+    if transport == "pipe":
+        transports = create_pipe_transports(nb_ranks)
+    elif transport == "socket":
+        addresses = [("localhost", get_free_port()) for _ in range(nb_ranks)]
+        transports = [addresses] * nb_ranks
+    else:
+        raise ValueError(
+            f"Unknown transport {transport!r} (available: 'pipe', 'socket')"
+        )
+
+    processes = []
+    connections = []
+    for rank in range(nb_ranks):
+        start, stop = limits[rank], limits[rank + 1]
+        connection_recv, connection_send = Pipe(duplex=False)
+        process = Process(
+            target=run_rank,
+            args=(
+                rank,
+                limits,
+                transports[rank],
+                time_step,
+                nb_steps,
+                masses[start:stop],
+                positions[start:stop],
+                velocities[start:stop],
+                connection_send,
+                timing,
+                step_start,
+                energy0,
+                energy_previous,
+            ),
+        )
+        process.start()
+        # only the rank keeps a send end: recv raises EOFError if it dies
+        connection_send.close()
+        processes.append(process)
+        connections.append(connection_recv)
+
+    # wait for the results and for the ends of the processes so that the
+    # failure of a rank is detected even if another rank is blocked in the
+    # ring communications
+    pending = dict(enumerate(connections))
+    while pending:
+        ready = wait(
+            list(pending.values())
+            + [processes[rank].sentinel for rank in pending]
+        )
+        for rank, connection in list(pending.items()):
+            sentinel = processes[rank].sentinel
+            if connection not in ready and sentinel not in ready:
+                continue
+            start, stop = limits[rank], limits[rank + 1]
+            try:
+                (
+                    positions[start:stop],
+                    velocities[start:stop],
+                    energy,
+                    energy0,
+                ) = connection.recv()
+            except EOFError:
+                processes[rank].join()
+                exitcode = processes[rank].exitcode
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.join()
+                raise RuntimeError(
+                    f"Rank {rank} failed (exit code {exitcode})"
+                ) from None
+            del pending[rank]
+    for process in processes:
+        process.join()
+
+    return energy, energy0
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    t_start = perf_counter()
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 10.0
+
+    try:
+        nb_ranks = int(sys.argv[3])
+    except IndexError:
+        nb_ranks = 0
+
+    try:
+        transport = sys.argv[4]
+    except IndexError:
+        transport = "pipe"
+
+    time_step = 0.001
+    nb_steps = int(time_end / time_step) + 1
+
+    path_input = sys.argv[1]
+    masses, positions, velocities = load_input_data(path_input)
+
+    energy, energy0 = loop(
+        time_step, nb_steps, masses, positions, velocities, nb_ranks, transport
+    )
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{nb_steps} time steps run in {timedelta(seconds=perf_counter()-t_start)}"
+    )
@@ -3,22 +3,13 @@ from time import perf_counter
 from datetime import timedelta
 
 import numpy as np
-import pandas as pd
 
-from transonic import jit
-
-
-def load_input_data(path):
-    df = pd.read_csv(
-        path, names=["mass", "x", "y", "z", "vx", "vy", "vz"], delimiter=r"\s+"
-    )
+from numba import objmode
 
-    # warning: copy() is for Pythran...
-    masses = df["mass"].values.copy()
-    positions = df.loc[:, ["x", "y", "z"]].values.copy()
-    velocities = df.loc[:, ["vx", "vy", "vz"]].values.copy()
+from transonic import jit
 
-    return masses, positions, velocities
+from nbabel.input_data import load_input_data
+from nbabel.timing import emit_durations
 
 
 def advance_positions(positions, velocities, accelerations, time_step):
@@ -65,14 +56,29 @@ def compute_accelerations(accelerations, masses, positions):
                 acceleration1[i] += coef_m0 * vector[i]
 
 
+def clock(timing):
+    """perf_counter (object mode) if timing, else 0"""
+    if not timing:
+        return 0.0
+    with objmode(time="float64"):
+        time = perf_counter()
+    return time
+
+
 @jit(backend="numba")
-def loop(
+def loop_phases(
     time_step: float,
     nb_steps: int,
     masses: "float[:]",
     positions: "float[:,:]",
     velocities: "float[:,:]",
+    timing: bool,
 ):
+    """Time steps, returns the energies and the durations of the phases
+
+    The durations are measured only if timing (timestamps in object mode, as
+    in bench_numba.py), they are 0 otherwise.
+    """
     accelerations = np.zeros_like(positions)
     accelerations1 = np.zeros_like(positions)
 
@@ -82,13 +88,25 @@ def loop(
     energy0, _, _ = compute_energies(masses, positions, velocities)
     energy_previous = energy0
 
+    # durations of the phases (pos, swap, acc, vel, ener)
+    durations = np.zeros(5)
+
     for step in range(nb_steps):
+        t0 = clock(timing)
         advance_positions(positions, velocities, accelerations, time_step)
+        t1 = clock(timing)
+        durations[0] += t1 - t0
         # swap acceleration arrays
         accelerations, accelerations1 = accelerations1, accelerations
         accelerations.fill(0)
+        t2 = clock(timing)
+        durations[1] += t2 - t1
         compute_accelerations(accelerations, masses, positions)
+        t3 = clock(timing)
+        durations[2] += t3 - t2
         advance_velocities(velocities, accelerations, accelerations1, time_step)
+        t4 = clock(timing)
+        durations[3] += t4 - t3
         time += time_step
 
         if not step % 100:
@@ -103,7 +121,18 @@ def loop(
                 (energy - energy_previous) / energy_previous,
             )
             energy_previous = energy
+        durations[4] += clock(timing) - t4
 
+    return energy, energy0, durations
+
+
+def loop(time_step, nb_steps, masses, positions, velocities, timing=False):
+    """timing: print the times of the phases (JSON line, see nbabel.timing)"""
+    energy, energy0, durations = loop_phases(
+        time_step, nb_steps, masses, positions, velocities, timing
+    )
+    if timing:
+        emit_durations("transonic-numba", masses.size, nb_steps, durations)
     return energy, energy0
 
 
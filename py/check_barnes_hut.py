@@ -0,0 +1,64 @@
+"""
+Compare the accelerations of the Barnes-Hut tree code to the direct sum
+
+python check_barnes_hut.py ../data/input1k
+
+The direct sum is computed with NumPy broadcasting (memory in N**2), so this
+check is meant for inputs up to a few thousands of particles.
+
+The relative error of the quadrupole expansion scales approximately as
+theta**3, so the tolerance depends on theta.
+
+"""
+
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from bench_barnes_hut import load_input_data, compute_accelerations
+
+
+def compute_accelerations_direct(masses, positions):
+    vectors = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    distances2 = np.sum(vectors ** 2, axis=2)
+    np.fill_diagonal(distances2, np.inf)
+    coefs = masses[np.newaxis, :] / distances2 ** 1.5
+    return -np.sum(coefs[:, :, np.newaxis] * vectors, axis=1)
+
+
+def check(masses, positions, accelerations_direct, theta):
+    accelerations = np.zeros_like(positions)
+    potentials = np.zeros_like(masses)
+    t_start = perf_counter()
+    compute_accelerations(accelerations, potentials, masses, positions, theta)
+    duration = perf_counter() - t_start
+
+    errors = np.linalg.norm(
+        accelerations - accelerations_direct, axis=1
+    ) / np.linalg.norm(accelerations_direct, axis=1)
+    error_median = np.median(errors)
+    error_99 = np.percentile(errors, 99)
+
+    tolerance_median = 0.02 * theta ** 3 + 1e-12
+    tolerance_99 = 0.1 * theta ** 3 + 1e-12
+    ok = error_median < tolerance_median and error_99 < tolerance_99
+    print(
+        f"theta = {theta:.2f}: relative error median = {error_median:.2e}, "
+        f"99th percentile = {error_99:.2e} ({duration:.3f} s) "
+        f"{'OK' if ok else 'FAILED'}"
+    )
+    return ok
+
+
+if __name__ == "__main__":
+
+    masses, positions, _ = load_input_data(sys.argv[1])
+    accelerations_direct = compute_accelerations_direct(masses, positions)
+
+    results = [
+        check(masses, positions, accelerations_direct, theta)
+        for theta in (0.0, 0.3, 0.5, 0.7, 1.0)
+    ]
+    if not all(results):
+        sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+Wall time to reach a given energy error: leapfrog (bench.py) vs Hermite
+
+python compare_hermite_leapfrog.py ../data/input1k 0.1 1e-8
+
+For each scheme, the simulation is run for a range of time steps and the
+fastest run with |dE/E| (final energy computed in this script) smaller than
+the target is reported.
+
+There is no softening and input1k contains close pairs, so the Hermite scheme
+reaches its asymptotic regime (error / ~30 when the time step is halved, / 4
+for the leapfrog) only for time steps <~ 0.001. A Hermite step costs ~2 times
+a leapfrog step (jerks), so Hermite wins only for small targets (1e-8 for input1k).
+
+warning: this script does not take care of compilation
+(make __pythran__/bench.py __pythran__/bench_hermite.py).
+
+"""
+
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from nbabel.input_data import load_input_data
+
+from bench import loop as loop_leapfrog
+from bench_hermite import loop as loop_hermite
+
+schemes = {
+    "leapfrog": (
+        loop_leapfrog,
+        [0.002, 0.001, 0.0005, 0.00025, 0.000125, 0.0000625],
+    ),
+    "hermite": (loop_hermite, [0.004, 0.002, 0.001, 0.0005, 0.00025]),
+}
+
+
+def compute_energy(masses, positions, velocities):
+    energy_kin = 0.5 * np.sum(masses * np.sum(velocities ** 2, 1))
+    vectors = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    distances = np.sqrt(np.sum(vectors ** 2, 2))
+    index0, index1 = np.triu_indices(masses.size, 1)
+    energy_pot = -np.sum(
+        masses[index0] * masses[index1] / distances[index0, index1]
+    )
+    return energy_kin + energy_pot
+
+
+def run(loop, time_step, time_end, masses, positions, velocities):
+    positions = positions.copy()
+    velocities = velocities.copy()
+    nb_steps = int(round(time_end / time_step))
+    t_start = perf_counter()
+    loop(time_step, nb_steps, masses, positions, velocities)
+    duration = perf_counter() - t_start
+    return duration, compute_energy(masses, positions, velocities)
+
+
+if __name__ == "__main__":
+
+    path_input = sys.argv[1]
+    try:
+        time_end = float(sys.argv[2])
+    except IndexError:
+        time_end = 0.1
+    try:
+        target = float(sys.argv[3])
+    except IndexError:
+        target = 1e-8
+
+    masses, positions, velocities = load_input_data(path_input)
+    energy0 = compute_energy(masses, positions, velocities)
+
+    results = []
+    for name, (loop, time_steps) in schemes.items():
+        for time_step in time_steps:
+            duration, energy = run(
+                loop, time_step, time_end, masses, positions, velocities
+            )
+            error = abs((energy - energy0) / energy0)
+            results.append((name, time_step, error, duration))
+
+    print(f"\n{masses.size} particles, t_end = {time_end}")
+    print(f"{'scheme':>10s} {'time step':>10s} {'|dE/E|':>10s} {'time (s)':>9s}")
+    for name, time_step, error, duration in results:
+        print(f"{name:>10s} {time_step:10.3g} {error:10.2e} {duration:9.3f}")
+
+    print(f"\nfastest runs with |dE/E| < {target:.1e}:")
+    for name in schemes:
+        durations = [
+            (duration, time_step)
+            for name_, time_step, error, duration in results
+            if name_ == name and error < target
+        ]
+        if durations:
+            duration, time_step = min(durations)
+            print(f"{name:>10s}: {duration:.3f} s (time step {time_step})")
+        else:
+            print(f"{name:>10s}: target not reached")
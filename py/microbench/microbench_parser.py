@@ -0,0 +1,84 @@
+"""
+Parsing of the input files: pandas vs nbabel.parser (np.loadtxt) vs cache
+
+python microbench_parser.py
+
+The default float parser of pandas is not correctly rounded (relative errors
+up to ~2e-13 for our files). np.loadtxt gives the same values as pandas with
+float_precision="round_trip".
+
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+path_py = Path(__file__).absolute().parent.parent
+path_data = path_py.parent / "data"
+sys.path.insert(0, str(path_py))
+
+import numpy as np
+import pandas as pd
+
+from nbabel.input_data import load_input_data
+from nbabel.parser import read_input_text
+
+
+def read_pandas(path, float_precision=None):
+    df = pd.read_csv(
+        path,
+        names=["mass", "x", "y", "z", "vx", "vy", "vz"],
+        delimiter=r"\s+",
+        float_precision=float_precision,
+    )
+    return df.values
+
+
+def timeit(func, nb_repeat=10):
+    times = []
+    for _ in range(nb_repeat):
+        t_start = perf_counter()
+        func()
+        times.append(perf_counter() - t_start)
+    return min(times)
+
+
+def time_import(module):
+    command = [sys.executable, "-c", f"import {module}"]
+    times = []
+    for _ in range(5):
+        t_start = perf_counter()
+        subprocess.run(command, check=True)
+        times.append(perf_counter() - t_start)
+    return min(times)
+
+
+if __name__ == "__main__":
+
+    print(
+        f"{'input':>10s} {'pandas (ms)':>12s} {'round_trip (ms)':>16s} "
+        f"{'loadtxt (ms)':>13s} {'cached (ms)':>12s}"
+    )
+    for name in ("input1k", "input2k", "input16k"):
+        path = path_data / name
+        data = read_input_text(path)
+        assert np.allclose(read_pandas(path), data, rtol=1e-12, atol=0)
+        assert np.array_equal(read_pandas(path, "round_trip"), data)
+        load_input_data(path)
+        time_pandas = timeit(lambda: read_pandas(path))
+        time_round_trip = timeit(lambda: read_pandas(path, "round_trip"))
+        time_loadtxt = timeit(lambda: read_input_text(path))
+        time_cached = timeit(lambda: load_input_data(path))
+        print(
+            f"{name:>10s} {1e3 * time_pandas:12.2f} "
+            f"{1e3 * time_round_trip:16.2f} "
+            f"{1e3 * time_loadtxt:13.2f} {1e3 * time_cached:12.3f}"
+        )
+
+    time_numpy = time_import("numpy")
+    time_pandas = time_import("pandas")
+    print(
+        f"\npython -c 'import numpy': {time_numpy:.3f} s, "
+        f"python -c 'import pandas': {time_pandas:.3f} s"
+    )
@@ -5,6 +5,8 @@ from transonic import boost
 from transonic.util import timeit_verbose as timeit
 
 dim = 3
+# number of partner particles computed at once in compute_soa_lanes
+nb_lanes = 8
 
 
 @boost
@@ -94,6 +96,98 @@ def compute_opt2(
         accelerations[index_p0] -= accs
 
 
+@boost
+def compute_soa(
+    accs_x: "float[:]",
+    accs_y: "float[:]",
+    accs_z: "float[:]",
+    masses: "float[:]",
+    xs: "float[:]",
+    ys: "float[:]",
+    zs: "float[:]",
+):
+    """Vectorized over index_p1 with slices of SoA arrays"""
+    nb_particules = masses.size
+    for index_p0 in range(nb_particules - 1):
+        start = index_p0 + 1
+        dx = xs[index_p0] - xs[start:]
+        dy = ys[index_p0] - ys[start:]
+        dz = zs[index_p0] - zs[start:]
+        d2 = dx * dx + dy * dy + dz * dz
+        inv_d3 = 1.0 / (d2 * np.sqrt(d2))
+        # reduction for the particle index_p0
+        coefs1 = masses[start:] * inv_d3
+        accs_x[index_p0] -= np.sum(coefs1 * dx)
+        accs_y[index_p0] -= np.sum(coefs1 * dy)
+        accs_z[index_p0] -= np.sum(coefs1 * dz)
+        # symmetric update of the partners
+        coefs0 = masses[index_p0] * inv_d3
+        accs_x[start:] += coefs0 * dx
+        accs_y[start:] += coefs0 * dy
+        accs_z[start:] += coefs0 * dz
+
+
+@boost
+def compute_soa_lanes(
+    accs_x: "float[:]",
+    accs_y: "float[:]",
+    accs_z: "float[:]",
+    masses: "float[:]",
+    xs: "float[:]",
+    ys: "float[:]",
+    zs: "float[:]",
+):
+    """nb_lanes partners per iteration (SoA), lane accumulators + reduction"""
+    nb_particules = masses.size
+    lanes_x = np.empty(nb_lanes)
+    lanes_y = np.empty(nb_lanes)
+    lanes_z = np.empty(nb_lanes)
+    for index_p0 in range(nb_particules - 1):
+        x0 = xs[index_p0]
+        y0 = ys[index_p0]
+        z0 = zs[index_p0]
+        mass0 = masses[index_p0]
+        lanes_x.fill(0)
+        lanes_y.fill(0)
+        lanes_z.fill(0)
+        start = index_p0 + 1
+        stop_lanes = start + nb_lanes * ((nb_particules - start) // nb_lanes)
+        for index_block in range(start, stop_lanes, nb_lanes):
+            for k in range(nb_lanes):
+                index_p1 = index_block + k
+                dx = x0 - xs[index_p1]
+                dy = y0 - ys[index_p1]
+                dz = z0 - zs[index_p1]
+                d2 = dx * dx + dy * dy + dz * dz
+                inv_d3 = 1.0 / (d2 * sqrt(d2))
+                coef1 = masses[index_p1] * inv_d3
+                lanes_x[k] -= coef1 * dx
+                lanes_y[k] -= coef1 * dy
+                lanes_z[k] -= coef1 * dz
+                coef0 = mass0 * inv_d3
+                accs_x[index_p1] += coef0 * dx
+                accs_y[index_p1] += coef0 * dy
+                accs_z[index_p1] += coef0 * dz
+        # remainder (less than nb_lanes partners)
+        for index_p1 in range(stop_lanes, nb_particules):
+            dx = x0 - xs[index_p1]
+            dy = y0 - ys[index_p1]
+            dz = z0 - zs[index_p1]
+            d2 = dx * dx + dy * dy + dz * dz
+            inv_d3 = 1.0 / (d2 * sqrt(d2))
+            coef1 = masses[index_p1] * inv_d3
+            lanes_x[0] -= coef1 * dx
+            lanes_y[0] -= coef1 * dy
+            lanes_z[0] -= coef1 * dz
+            coef0 = mass0 * inv_d3
+            accs_x[index_p1] += coef0 * dx
+            accs_y[index_p1] += coef0 * dy
+            accs_z[index_p1] += coef0 * dz
+        accs_x[index_p0] += np.sum(lanes_x)
+        accs_y[index_p0] += np.sum(lanes_y)
+        accs_z[index_p0] += np.sum(lanes_z)
+
+
 shape = 1024, dim
 print("shape=", shape)
 
@@ -114,6 +208,25 @@ timeit("compute_opt(accelerations, masses, positions)", globals=glo, norm=norm)
 timeit("compute_opt1(accelerations, masses, positions)", globals=glo, norm=norm)
 timeit("compute_opt2(accelerations, masses, positions)", globals=glo, norm=norm)
 
+# structure of arrays (non-zero masses and 3d positions so that the check
+# is meaningful)
+rng = np.random.default_rng(0)
+masses_soa = rng.uniform(0.5, 1.5, shape[0]) / shape[0]
+positions_soa = rng.uniform(-1.0, 1.0, shape)
+xs, ys, zs = (positions_soa[:, i].copy() for i in range(dim))
+
+accelerations_ref = np.zeros_like(positions_soa)
+compute_opt2(accelerations_ref, masses_soa, positions_soa)
+for func in (compute_soa, compute_soa_lanes):
+    accs = [np.zeros(shape[0]) for _ in range(dim)]
+    func(*accs, masses_soa, xs, ys, zs)
+    assert np.allclose(np.stack(accs, axis=1), accelerations_ref), func
+
+accs_x, accs_y, accs_z = (np.zeros(shape[0]) for _ in range(dim))
+args_soa = "accs_x, accs_y, accs_z, masses_soa, xs, ys, zs"
+timeit(f"compute_soa({args_soa})", globals=glo, norm=norm)
+timeit(f"compute_soa_lanes({args_soa})", globals=glo, norm=norm)
+
 
 """
 Oh, `pythran -P` gives:
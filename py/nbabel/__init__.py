@@ -0,0 +1 @@
+"""Code shared by the Python implementations of the nbabel benchmark"""
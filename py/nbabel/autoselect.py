@@ -0,0 +1,137 @@
+"""Automatic selection of the fastest compiled engine
+
+The compiled engines available (Pythran extension built, Numba installed,
+...) are timed on the actual input (one evaluation of the accelerations with
+the kernel used by their loop function, nothing is printed). The verdict is
+cached on disk per (host, number of particles rounded to a power
+of 2, number of threads), in `~/.cache/nbabel/autoselect.json`.
+
+"""
+
+import json
+import os
+import platform
+from datetime import datetime
+from math import log2
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from .engines import get_engine
+
+# used when no compiled engine is available
+fallback = "numpy"
+
+
+def get_path_cache():
+    path_base = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(path_base) / "nbabel" / "autoselect.json"
+
+
+def get_key(nb_particles):
+    bucket = 2 ** round(log2(nb_particles))
+    nb_threads = os.environ.get("OMP_NUM_THREADS", os.cpu_count())
+    return f"{platform.node()}_{bucket}_{nb_threads}"
+
+
+def load_cache():
+    try:
+        with open(get_path_cache()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    path = get_path_cache()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(path_tmp, "w") as file:
+        json.dump(cache, file, indent=2)
+    os.replace(path_tmp, path)
+
+
+def make_kernel_sequential(module, masses, positions):
+    accelerations = np.zeros_like(positions)
+
+    def compute():
+        module.compute_accelerations(accelerations, masses, positions)
+
+    return compute
+
+
+def make_kernel_omp(module, masses, positions):
+    # one copy of the accelerations per thread (default mode of bench_omp)
+    accelerations = np.zeros((module.get_num_threads(),) + positions.shape)
+
+    def compute():
+        module.accelerate(accelerations, masses, positions, False)
+
+    return compute
+
+
+def make_kernel_numba_parallel(module, masses, positions):
+    accelerations = np.empty_like(positions)
+
+    def compute():
+        module.compute_accelerations_parallel(accelerations, masses, positions)
+
+    return compute
+
+
+# functions returning a function computing the accelerations once
+kernels = {
+    "pythran": make_kernel_sequential,
+    "pythran-omp": make_kernel_omp,
+    "numba": make_kernel_sequential,
+    "numba-parallel": make_kernel_numba_parallel,
+}
+
+candidates = list(kernels)
+
+
+def time_kernel(name, masses, positions):
+    engine = get_engine(name)
+    compute = kernels[name](engine.import_module(), masses, positions)
+    t_start = perf_counter()
+    compute()
+    return perf_counter() - t_start
+
+
+def calibrate(masses, positions):
+    """Time the available compiled engines, return a dict {name: duration}"""
+    durations = {}
+    for name in candidates:
+        if not get_engine(name).is_compiled():
+            continue
+        # warmup (JIT compilation / loading of the Numba cache)
+        time_kernel(name, masses[:16], positions[:16])
+        durations[name] = time_kernel(name, masses, positions)
+    return durations
+
+
+def select_engine(masses, positions, velocities, use_cache=True):
+    """Name of the fastest engine for this input on this machine"""
+    key = get_key(masses.size)
+    cache = load_cache()
+    if use_cache and key in cache:
+        return cache[key]["engine"]
+
+    durations = calibrate(masses, positions)
+    if not durations:
+        print(f"No compiled engine available, using {fallback!r}")
+        return fallback
+
+    engine = min(durations, key=durations.get)
+    cache[key] = {
+        "engine": engine,
+        "nb_particles": int(masses.size),
+        "durations": durations,
+        "date": datetime.now().isoformat(timespec="seconds"),
+    }
+    try:
+        save_cache(cache)
+    except OSError:
+        pass
+    return engine
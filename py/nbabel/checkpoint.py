@@ -0,0 +1,81 @@
+"""Checkpoints of the simulations (see run_simulation in nbabel.driver)
+
+A checkpoint is a `.npz` file with the state of a simulation after a number
+of time steps (positions, velocities, step index, initial energy, ...). The
+file is written atomically (temporary file + rename), so that a crash during
+a write leaves the previous checkpoint untouched, and asynchronously (in a
+thread, from copies of the arrays) while the next time steps are computed.
+
+The accelerations are not saved: the loop functions of the engines compute
+them from the positions before the first time step, which gives exactly the
+values of the last time step before the checkpoint. A restarted simulation
+is therefore bit-identical to an uninterrupted one.
+
+"""
+
+import os
+from pathlib import Path
+from threading import Thread
+
+import numpy as np
+
+
+def save_checkpoint(path, state):
+    """Write a checkpoint atomically"""
+    path = Path(path)
+    path_tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(path_tmp, "wb") as file:
+            np.savez(file, **state)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path_tmp, path)
+    except BaseException:
+        try:
+            path_tmp.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def load_checkpoint(path):
+    """Return the state saved in a checkpoint (dict)"""
+    with np.load(path, allow_pickle=False) as data:
+        state = {key: data[key] for key in data.files}
+    # 0d arrays to Python scalars
+    for key, value in state.items():
+        if value.ndim == 0:
+            state[key] = value.item()
+    return state
+
+
+class CheckpointWriter:
+    """Write checkpoints in a background thread (one at a time)
+
+    The errors of a write are raised by the next call of `submit` or `wait`.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._error = None
+
+    def submit(self, path, state):
+        self.wait()
+        # copies: the arrays are modified by the next time steps
+        state = {key: np.array(value) for key, value in state.items()}
+        self._thread = Thread(target=self._write, args=(path, state))
+        self._thread.start()
+
+    def _write(self, path, state):
+        try:
+            save_checkpoint(path, state)
+        except BaseException as error:
+            self._error = error
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
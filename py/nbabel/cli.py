@@ -0,0 +1,261 @@
+"""Command line interface
+
+python -m nbabel list
+python -m nbabel run --engine numba --input ../data/input1k --t-end 0.1
+python -m nbabel run --engine pythran --input ../data/input16k -o tile_size=256
+python -m nbabel run --engine auto --input ../data/input16k
+python -m nbabel run --engine pythran --input ../data/input16k \\
+    --checkpoint run16k.npz [--restart]
+python -m nbabel run --engine pythran --input ../data/input1k \\
+    --snapshots traj1k.h5 --snapshot-period 100 --snapshot-compression gzip
+python -m nbabel run --engine numba --input ../data/input1k --timing
+python -m nbabel calibrate --input ../data/input16k
+python -m nbabel plummer 65536 ../data/input64k --seed 0
+python -m nbabel suite --engines pythran numba-parallel --threads 1 4 \\
+    --repeat 5 --generate 32768 --output results/suite
+
+"""
+
+import argparse
+from ast import literal_eval
+from datetime import timedelta
+
+from .autoselect import get_key, get_path_cache, load_cache, select_engine
+from .engines import engines
+from .driver import run_simulation
+from .input_data import load_input_data
+from .plummer import write_plummer
+from .suite import default_engines, run_suite
+
+
+def parse_option(text):
+    try:
+        name, value = text.split("=", 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Options have to be given as NAME=VALUE (not {text!r})"
+        ) from None
+    try:
+        value = literal_eval(value)
+    except (ValueError, SyntaxError):
+        # strings can be given without quotes (-o kernel=numpy)
+        pass
+    return name, value
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="nbabel", description="Run the nbabel benchmark"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="list the engines and their options")
+
+    parser_run = subparsers.add_parser("run", help="run a simulation")
+    parser_run.add_argument(
+        "--engine", "-e", default="pythran", choices=list(engines) + ["auto"]
+    )
+    parser_run.add_argument(
+        "--input", "-i", required=True, help="input file (nbabel format)"
+    )
+    parser_run.add_argument("--t-end", type=float, default=10.0)
+    parser_run.add_argument("--time-step", type=float, default=0.001)
+    parser_run.add_argument(
+        "--option",
+        "-o",
+        type=parse_option,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="option of the loop function of the engine (can be repeated)",
+    )
+    parser_run.add_argument(
+        "--checkpoint", help="checkpoint file (.npz), saved periodically"
+    )
+    parser_run.add_argument(
+        "--checkpoint-period",
+        type=int,
+        default=1000,
+        help="number of time steps between checkpoints (multiple of 100)",
+    )
+    parser_run.add_argument(
+        "--restart",
+        action="store_true",
+        help="resume the simulation from the checkpoint",
+    )
+    parser_run.add_argument(
+        "--snapshots",
+        help="trajectory output (.h5: HDF5, otherwise directory of .npy)",
+    )
+    parser_run.add_argument(
+        "--snapshot-period",
+        type=int,
+        default=100,
+        help="number of time steps between snapshots (multiple of 100)",
+    )
+    parser_run.add_argument(
+        "--snapshot-compression",
+        help="HDF5 compression (for example gzip or lzf)",
+    )
+    parser_run.add_argument(
+        "--timing",
+        action="store_true",
+        help="print the times of the phases of the loop (JSON lines)",
+    )
+
+    parser_calibrate = subparsers.add_parser(
+        "calibrate",
+        help="time the compiled engines on an input (used by --engine auto)",
+    )
+    parser_calibrate.add_argument(
+        "--input", "-i", required=True, help="input file (nbabel format)"
+    )
+
+    parser_plummer = subparsers.add_parser(
+        "plummer", help="write Plummer initial conditions"
+    )
+    parser_plummer.add_argument("nb_particles", type=int)
+    parser_plummer.add_argument(
+        "output", help="output file (binary format if it ends with .npy)"
+    )
+    parser_plummer.add_argument("--seed", type=int, default=0)
+    parser_plummer.add_argument(
+        "--exact-energy",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="rescale with the exact potential energy, O(N**2) "
+        "(default: only for N <= 65536)",
+    )
+
+    parser_suite = subparsers.add_parser(
+        "suite",
+        help="benchmark suite (engines x threads x inputs), CSV/JSON results",
+    )
+    parser_suite.add_argument(
+        "--engines",
+        nargs="+",
+        default=default_engines,
+        choices=list(engines),
+        metavar="ENGINE",
+    )
+    parser_suite.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        help="numbers of threads of the parallel engines "
+        "(default: number of cpus)",
+    )
+    parser_suite.add_argument("--repeat", type=int, default=3)
+    parser_suite.add_argument(
+        "--t-end",
+        type=float,
+        help="default: ~2**30 / N**2 time steps (between 10 and 1000)",
+    )
+    parser_suite.add_argument(
+        "--max-size", type=int, help="largest number of particles"
+    )
+    parser_suite.add_argument(
+        "--generate",
+        nargs="+",
+        type=int,
+        default=[],
+        metavar="N",
+        help="sizes of Plummer inputs generated in ../data",
+    )
+    parser_suite.add_argument(
+        "--output",
+        default="bench_suite",
+        help="base name of the result files (.csv and .json)",
+    )
+    return parser
+
+
+def list_engines():
+    for name, engine in engines.items():
+        print(f"{name:12s} {engine.description} ({engine.module_name}.py)")
+        for option, default in engine.options.items():
+            print(f"{'':14s}-o {option}={default!r}")
+
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        list_engines()
+        return
+
+    if args.command == "plummer":
+        try:
+            write_plummer(
+                args.output, args.nb_particles, args.seed, args.exact_energy
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        return
+
+    if args.command == "suite":
+        try:
+            run_suite(
+                args.engines,
+                args.threads,
+                args.repeat,
+                args.t_end,
+                args.max_size,
+                args.generate,
+                args.output,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        return
+
+    if args.command == "calibrate":
+        masses, positions, velocities = load_input_data(args.input)
+        engine = select_engine(masses, positions, velocities, use_cache=False)
+        durations = load_cache().get(get_key(masses.size), {})
+        for name, duration in durations.get("durations", {}).items():
+            print(f"{name:16s} {duration:.4f} s")
+        print(f"fastest engine: {engine} (saved in {get_path_cache()})")
+        return
+
+    options = dict(args.option)
+    if args.restart and args.checkpoint is None:
+        parser.error("--restart requires --checkpoint")
+    if args.engine == "auto":
+        if set(options) - {"timing"}:
+            parser.error("No options can be given with --engine auto")
+    else:
+        try:
+            engines[args.engine].make_option_args(**options)
+        except ValueError as error:
+            parser.error(str(error))
+    # -o timing=True is the same as --timing (not saved in the checkpoints)
+    timing = options.pop("timing", False)
+    if not isinstance(timing, int):
+        parser.error(f"Option 'timing' has to be a bool, not {timing!r}")
+    timing = args.timing or bool(timing)
+
+    try:
+        result = run_simulation(
+            args.engine,
+            args.input,
+            args.t_end,
+            args.time_step,
+            args.checkpoint,
+            args.checkpoint_period,
+            args.restart,
+            args.snapshots,
+            args.snapshot_period,
+            args.snapshot_compression,
+            timing,
+            **options,
+        )
+    except (ValueError, FileNotFoundError, ImportError) as error:
+        parser.error(str(error))
+    energy = result["energy"]
+    energy0 = result["energy0"]
+    duration = result["duration_load"] + result["duration_loop"]
+    print(f"Final dE/E = {(energy - energy0) / energy0:.6e}")
+    print(
+        f"{result['nb_steps']} time steps run in {timedelta(seconds=duration)}"
+    )
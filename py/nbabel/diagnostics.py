@@ -0,0 +1,146 @@
+"""Energies computed in a background thread (non-blocking diagnostics)
+
+The loop functions stop the time stepping every 100 steps to compute the
+energies (an O(N**2) pass) and print them. With EnergyDiagnostics, the
+integrator only copies the state (positions and velocities) into one of a
+small ring of buffers (see nbabel.snapshots) and a thread computes the
+energies and prints them and/or writes them to a log file (one line per
+diagnostic, flushed).
+
+The potential energy kernel is compiled with Numba (nogil=True) if it is
+installed, otherwise it is written with Numpy (the Numpy functions release
+the GIL for most of the time), so that the thread runs in parallel with the
+time steps (which also have to release the GIL, as the Pythran functions).
+
+The worker uses one core: for OpenMP engines, one thread less can be given
+to the integrator (OMP_NUM_THREADS).
+
+With block=False in `submit`, a diagnostic is skipped (and counted in
+`nb_skipped`) if no buffer is free, so the integrator never waits for the
+worker.
+
+"""
+
+from math import sqrt
+
+import numpy as np
+
+from .kernels import compute_potential_energy_rows_numpy
+from .snapshots import SnapshotWriter
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def compute_potential_energy_lowlevel(masses, positions):
+    nb_particles = masses.size
+    energy = 0.0
+    for index_p0 in range(nb_particles - 1):
+        x0 = positions[index_p0, 0]
+        y0 = positions[index_p0, 1]
+        z0 = positions[index_p0, 2]
+        energy_row = 0.0
+        for index_p1 in range(index_p0 + 1, nb_particles):
+            distance = sqrt(
+                (x0 - positions[index_p1, 0]) ** 2
+                + (y0 - positions[index_p1, 1]) ** 2
+                + (z0 - positions[index_p1, 2]) ** 2
+            )
+            energy_row -= masses[index_p1] / distance
+        energy += masses[index_p0] * energy_row
+    return energy
+
+
+if njit is not None:
+    compute_potential_energy = njit(cache=True, fastmath=True, nogil=True)(
+        compute_potential_energy_lowlevel
+    )
+else:
+    compute_potential_energy = compute_potential_energy_rows_numpy
+
+
+def compute_energies(masses, positions, velocities):
+    energy_kin = 0.5 * np.dot(masses, np.sum(velocities ** 2, 1))
+    energy_pot = compute_potential_energy(masses, positions)
+    return energy_kin + energy_pot, energy_kin, energy_pot
+
+
+class EnergyDiagnostics(SnapshotWriter):
+    """Compute the energies of the submitted states in a thread
+
+    The lines printed have the format of the loop functions (with the time
+    of the submitted state). The log file contains the columns `step time
+    energy energy_kin energy_pot`.
+
+    After `close`, `energies` contains the rows (step, energy, energy_kin,
+    energy_pot) in the order of submission, and `energy` and `energy0` are
+    the last and the first energies.
+
+    With energy_previous (continuation of a simulation), the first
+    diagnostic is also printed (dE/E relative to energy_previous) and the
+    lines are appended to the log file.
+    """
+
+    def __init__(
+        self,
+        masses,
+        time_step,
+        path_log=None,
+        verbose=True,
+        nb_buffers=2,
+        energy_previous=None,
+    ):
+        self.masses = masses
+        self.time_step = time_step
+        self.verbose = verbose
+        self.energies = []
+        self.nb_skipped = 0
+        self.energy_previous = energy_previous
+        if path_log and energy_previous is not None:
+            self.file_log = open(path_log, "a")
+        elif path_log:
+            self.file_log = open(path_log, "w")
+            self.file_log.write("# step time energy energy_kin energy_pot\n")
+            self.file_log.flush()
+        else:
+            self.file_log = None
+        super().__init__(masses.size, nb_buffers)
+
+    def submit(self, step, positions, velocities, block=True):
+        submitted = super().submit(step, positions, velocities, block)
+        if not submitted:
+            self.nb_skipped += 1
+        return submitted
+
+    @property
+    def energy(self):
+        return self.energies[-1][1]
+
+    @property
+    def energy0(self):
+        return self.energies[0][1]
+
+    def write_frame(self, step, positions, velocities):
+        energy, energy_kin, energy_pot = compute_energies(
+            self.masses, positions, velocities
+        )
+        self.energies.append((step, energy, energy_kin, energy_pot))
+        time = step * self.time_step
+        if self.verbose and self.energy_previous is not None:
+            energy_previous = self.energy_previous
+            print(
+                f"t = {time:5.2f}, E = {energy:.10f}, "
+                f"dE/E = {(energy - energy_previous) / energy_previous:+.10f}"
+            )
+        self.energy_previous = energy
+        if self.file_log is not None:
+            self.file_log.write(
+                f"{step} {time:.6g} {energy:.17g} {energy_kin:.17g} "
+                f"{energy_pot:.17g}\n"
+            )
+            self.file_log.flush()
+
+    def close_file(self):
+        if self.file_log is not None:
+            self.file_log.close()
@@ -0,0 +1,203 @@
+"""Run a simulation with an engine (in-process, see also nbabel.cli)"""
+
+from time import perf_counter
+
+from .autoselect import select_engine
+from .checkpoint import CheckpointWriter, load_checkpoint
+from .engines import get_engine
+from .input_data import load_input_data
+from .snapshots import create_snapshot_writer
+
+# the loop functions compute the energy every 100 time steps
+period_energy = 100
+
+
+def compute_nb_steps(time_end, time_step):
+    # same convention as the bench scripts
+    return int(time_end / time_step) + 1
+
+
+def run_simulation(
+    engine_name,
+    path_input,
+    time_end=10.0,
+    time_step=0.001,
+    checkpoint=None,
+    checkpoint_period=1000,
+    restart=False,
+    snapshots=None,
+    snapshot_period=100,
+    snapshot_compression=None,
+    timing=False,
+    **options,
+):
+    """Load the input file and run the loop of an engine
+
+    `options` are passed to the loop function of the engine (for example
+    tile_size for "pythran" or theta for "barnes-hut").
+
+    With engine_name="auto", the fastest compiled engine is selected (see
+    nbabel.autoselect).
+
+    With a checkpoint path, the loop function is called for segments of
+    `checkpoint_period` time steps (multiple of 100) and the state is saved
+    after each segment (see nbabel.checkpoint). With restart=True, the
+    simulation is resumed from the checkpoint (bit-identical results). The
+    segments continue the simulation (step offset, initial and last
+    energies passed to the loop function, see nbabel.engines), so that the
+    output is the same as for one call of the loop function.
+
+    With a snapshots path, the positions and velocities are saved every
+    `snapshot_period` time steps (multiple of 100) by a background thread
+    (see nbabel.snapshots, HDF5 for .h5 paths, directory of .npy frames
+    otherwise).
+
+    With timing=True, each call of the loop function prints the times of its
+    phases as a JSON line (see nbabel.timing). This option is not part of
+    the options saved in the checkpoints.
+
+    Returns a dict with the final and initial energies, the number of time
+    steps and the elapsed times (duration_load includes the selection of the
+    engine).
+    """
+    if restart and checkpoint is None:
+        raise ValueError("restart=True requires a checkpoint path")
+    # the segments start at multiples of period_energy so that the energies
+    # are computed at the same time steps as for one call of loop
+    periods = {}
+    if checkpoint is not None:
+        periods["checkpoint_period"] = checkpoint_period
+    if snapshots is not None:
+        periods["snapshot_period"] = snapshot_period
+    for name, period in periods.items():
+        if period <= 0 or period % period_energy:
+            raise ValueError(
+                f"{name} has to be a multiple of {period_energy} "
+                f"(not {period})"
+            )
+
+    t_start = perf_counter()
+    masses, positions, velocities = load_input_data(path_input)
+    nb_steps = compute_nb_steps(time_end, time_step)
+    step = 0
+    energy = energy0 = None
+    if restart:
+        state = load_checkpoint(checkpoint)
+        check_checkpoint(state, engine_name, options, masses, time_step)
+        if state["step"] > nb_steps:
+            raise ValueError(
+                f"The checkpoint is at step {state['step']} > {nb_steps}"
+            )
+        engine_name = state["engine"]
+        positions[:] = state["positions"]
+        velocities[:] = state["velocities"]
+        step = state["step"]
+        energy = state["energy"]
+        energy0 = state["energy0"]
+
+    if engine_name == "auto":
+        if options:
+            raise ValueError('No options can be given with engine="auto"')
+        engine_name = select_engine(masses, positions, velocities)
+        print(f"engine selected: {engine_name}")
+    engine = get_engine(engine_name)
+    if timing:
+        options_loop = dict(options, timing=True)
+    else:
+        options_loop = options
+    option_args = engine.make_option_args(**options_loop)
+    loop = engine.get_loop()
+    t_loaded = perf_counter()
+
+    if not periods:
+        energy, energy0 = loop(
+            time_step, nb_steps, masses, positions, velocities, *option_args
+        )
+    else:
+        writer = CheckpointWriter()
+        if snapshots is not None:
+            snapshot_writer = create_snapshot_writer(
+                snapshots, masses, time_step, step, snapshot_compression
+            )
+        try:
+            if snapshots is not None and not step % snapshot_period:
+                snapshot_writer.submit(step, positions, velocities)
+            while step < nb_steps:
+                step_stop = nb_steps
+                for period in periods.values():
+                    step_stop = min(step_stop, (step // period + 1) * period)
+                if step:
+                    # no new computation of the initial energy, the times and
+                    # dE/E follow the previous segment
+                    args = engine.make_continuation_args(
+                        step, energy0, energy, **options_loop
+                    )
+                else:
+                    args = option_args
+                energy, energy0 = loop(
+                    time_step,
+                    step_stop - step,
+                    masses,
+                    positions,
+                    velocities,
+                    *args,
+                )
+                step = step_stop
+                if snapshots is not None and not step % snapshot_period:
+                    snapshot_writer.submit(step, positions, velocities)
+                if checkpoint is not None and (
+                    not step % checkpoint_period or step == nb_steps
+                ):
+                    writer.submit(
+                        checkpoint,
+                        {
+                            "engine": engine_name,
+                            "options": repr(sorted(options.items())),
+                            "nb_particles": masses.size,
+                            "time_step": time_step,
+                            "step": step,
+                            "energy": energy,
+                            "energy0": energy0,
+                            "positions": positions,
+                            "velocities": velocities,
+                        },
+                    )
+        finally:
+            writer.wait()
+            if snapshots is not None:
+                snapshot_writer.close()
+    t_end = perf_counter()
+
+    return {
+        "engine": engine_name,
+        "path_input": str(path_input),
+        "nb_particles": masses.size,
+        "nb_steps": nb_steps,
+        "energy": energy,
+        "energy0": energy0,
+        "duration_load": t_loaded - t_start,
+        "duration_loop": t_end - t_loaded,
+    }
+
+
+def check_checkpoint(state, engine_name, options, masses, time_step):
+    """Raise ValueError if the checkpoint is not from the same simulation"""
+    if state["nb_particles"] != masses.size:
+        raise ValueError(
+            f"The checkpoint has {state['nb_particles']} particles "
+            f"(input: {masses.size})"
+        )
+    if state["time_step"] != time_step:
+        raise ValueError(
+            f"The checkpoint has time_step={state['time_step']} "
+            f"(not {time_step})"
+        )
+    # engine="auto": the engine of the checkpoint is used
+    if engine_name != "auto" and (
+        state["engine"] != engine_name
+        or state["options"] != repr(sorted(options.items()))
+    ):
+        raise ValueError(
+            f"The checkpoint was computed with engine {state['engine']!r} "
+            f"and options {state['options']}"
+        )
@@ -0,0 +1,235 @@
+"""Registry of the implementations ("engines")
+
+An engine is a module of the directory py (for example bench.py) with a
+function `loop(time_step, nb_steps, masses, positions, velocities, ...)`.
+The modules are imported only when an engine is used, so that missing
+optional dependencies (Numba, Pythran extensions, ...) only matter for the
+engines using them.
+
+The optional arguments of the loop functions are declared with their default
+values (in order) because Pythran functions only accept keyword arguments
+when all the previous arguments are given.
+
+All loop functions accept the option `timing` (print the times of the phases
+as a JSON line, see nbabel.timing) and, after all the options, the arguments
+`step_start`, `energy0` and `energy_previous` used to continue a simulation
+(see nbabel.driver): with step_start > 0, the time steps are numbered from
+step_start (times and energy output as for one call of the loop function),
+the initial energy is not computed and energy_previous (last energy
+computed) is used for the first dE/E.
+
+For the compiled engines, `compiled_func_name` is the name of the function
+compiled by Pythran or Numba (the loop function itself or the function
+called by a Python wrapper). Transonic falls back to the Python function if
+the extension is not built, so that the engine is then not compiled.
+
+"""
+
+import importlib
+import sys
+import types
+from pathlib import Path
+
+path_py = Path(__file__).absolute().parent.parent
+
+
+class Engine:
+    """Lazy reference to a loop function"""
+
+    def __init__(
+        self,
+        name,
+        module_name,
+        description,
+        options=None,
+        func_name="loop",
+        compiled_func_name=None,
+    ):
+        self.name = name
+        self.module_name = module_name
+        self.description = description
+        if options is None:
+            options = {}
+        self.options = options
+        self.func_name = func_name
+        self.compiled_func_name = compiled_func_name
+
+    def __repr__(self):
+        return f"Engine({self.name!r}, {self.module_name}.{self.func_name})"
+
+    def import_module(self):
+        if str(path_py) not in sys.path:
+            sys.path.insert(0, str(path_py))
+        return importlib.import_module(self.module_name)
+
+    def get_loop(self):
+        return getattr(self.import_module(), self.func_name)
+
+    def is_compiled(self):
+        """True if the compiled function of the engine can be used"""
+        if self.compiled_func_name is None:
+            return False
+        try:
+            module = self.import_module()
+        except ImportError:
+            return False
+        func = getattr(module, self.compiled_func_name)
+        # Transonic falls back to the Python function if not compiled
+        return not isinstance(func, types.FunctionType)
+
+    def make_option_args(self, **options):
+        """Positional arguments for the options of the loop function"""
+        unknown = set(options) - set(self.options)
+        if unknown:
+            raise ValueError(
+                f"Unknown options {sorted(unknown)} for engine {self.name!r} "
+                f"(available: {list(self.options)})"
+            )
+        names = list(self.options)
+        # no need to give the trailing default values
+        nb_args = max((names.index(name) + 1 for name in options), default=0)
+        args = []
+        for name in names[:nb_args]:
+            default = self.options[name]
+            value = options.get(name, default)
+            # bool("false") is True: only bool and int values for bool options
+            if isinstance(default, bool) and not isinstance(value, int):
+                raise ValueError(
+                    f"Option {name!r} of engine {self.name!r} has to be a "
+                    f"bool (True/False/1/0), not {value!r}"
+                )
+            # the types have to match the Pythran signatures (int, float, bool)
+            args.append(type(default)(value))
+        return args
+
+    def make_continuation_args(
+        self, step_start, energy0, energy_previous, **options
+    ):
+        """Positional arguments to continue a simulation from step_start"""
+        # all the options have to be given before the continuation arguments
+        args = self.make_option_args(**dict(self.options, **options))
+        return args + [int(step_start), float(energy0), float(energy_previous)]
+
+
+engines = {}
+
+
+def register_engine(
+    name,
+    module_name,
+    description,
+    options=None,
+    func_name="loop",
+    compiled_func_name=None,
+):
+    if name in engines:
+        raise ValueError(f"Engine {name!r} is already registered")
+    engines[name] = Engine(
+        name, module_name, description, options, func_name, compiled_func_name
+    )
+
+
+def get_engine(name):
+    try:
+        return engines[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown engine {name!r}. Available engines: {', '.join(engines)}"
+        ) from None
+
+
+register_engine(
+    "pythran",
+    "bench",
+    "Transonic-Pythran, sequential",
+    {
+        "tile_size": 0,
+        "fuse_energy": False,
+        "mixed_precision": False,
+        "nb_newton_float32": -1,
+        "timing": False,
+    },
+    compiled_func_name="loop_phases",
+)
+register_engine(
+    "pythran-omp",
+    "bench_omp",
+    "Transonic-Pythran with OpenMP (-fopenmp)",
+    {"fuse_energy": False, "full_row": False, "timing": False},
+    compiled_func_name="loop_phases",
+)
+register_engine(
+    "pythran-omp-async",
+    "bench_omp",
+    "Transonic-Pythran with OpenMP, energies computed in a thread",
+    {"full_row": False, "path_log": "", "timing": False},
+    func_name="loop_async_energy",
+    compiled_func_name="loop_phases",
+)
+register_engine(
+    "pythran-float4",
+    "bench_float4",
+    "Transonic-Pythran, positions padded to 4 (masses in the 4th column)",
+    {"full_row": False, "timing": False},
+    compiled_func_name="loop_aos4",
+)
+register_engine(
+    "numba",
+    "bench_numba",
+    "Numba, sequential (nb_threads > 0: parallel kernels)",
+    {"nb_threads": 0, "timing": False},
+    compiled_func_name="loop",
+)
+register_engine(
+    "numba-parallel",
+    "bench_numba",
+    "Numba, parallel (prange, number of threads: NUMBA_NUM_THREADS)",
+    {"timing": False},
+    func_name="loop_parallel",
+    compiled_func_name="loop",
+)
+register_engine(
+    "numpy",
+    "bench_numpy_highlevel",
+    "high-level Numpy code",
+    {"timing": False},
+)
+register_engine(
+    "multiprocessing",
+    "bench_multiprocessing",
+    "process pool + shared memory (Numba or Numpy kernels, no OpenMP)",
+    {"nb_workers": 0, "kernel": "", "timing": False},
+)
+register_engine(
+    "ring",
+    "bench_ring",
+    "ring (systolic) decomposition over processes (Numba kernels)",
+    {"nb_ranks": 0, "transport": "pipe", "timing": False},
+)
+register_engine(
+    "purepy",
+    "bench_purepy_Particle",
+    "pure Python (much faster with PyPy)",
+    {"timing": False},
+)
+register_engine(
+    "hermite",
+    "bench_hermite",
+    "4th order Hermite scheme (Pythran, accelerations and jerks)",
+    {"timing": False},
+    compiled_func_name="loop_phases",
+)
+register_engine(
+    "block-steps",
+    "bench_block_steps",
+    "Hermite scheme with block time steps (time_step: largest step)",
+    {"eta": 0.02, "eta_start": 0.01, "max_level": 30, "timing": False},
+    compiled_func_name="correct_active",
+)
+register_engine(
+    "barnes-hut",
+    "bench_barnes_hut",
+    "Barnes-Hut tree code (Pythran)",
+    {"theta": 0.5, "timing": False},
+    compiled_func_name="loop_phases",
+)
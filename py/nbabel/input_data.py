@@ -0,0 +1,141 @@
+"""Load the input files (nbabel text format)
+
+The first time a file is loaded, the data is saved in a binary sidecar file
+(hidden `.npy` file next to the input file, its name contains the size and
+the modification time of the input file). The next loads use this file,
+memory-mapped in copy-on-write mode, so that the arrays can be modified by
+the integrators without touching the cache.
+
+The sidecar contains one contiguous float64 array with the masses, the
+positions and the velocities, so that the 3 returned arrays are contiguous
+views of the memory-mapped file. Files in this binary format (name ending
+with `.npy`, see nbabel.plummer) can also be given directly.
+
+Two layouts of the returned arrays are available:
+
+- "aos3" (default): masses (N,), positions and velocities (N, 3),
+- "aos4": positions and velocities padded to 4 columns (N, 4), with the masses
+  in the 4th column of the positions (0 in the 4th column of the velocities).
+  A particle is 32 bytes aligned, which maps onto SIMD registers.
+
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .parser import read_input_text
+
+
+def get_path_cache(path):
+    stat = path.stat()
+    return path.with_name(f".{path.name}.{stat.st_size}_{stat.st_mtime_ns}.npy")
+
+
+def read_text(path):
+    """Parse the text file and return the flat array of the data"""
+    data = read_input_text(path)
+    return np.concatenate(
+        (data[:, 0], data[:, 1:4].ravel(), data[:, 4:].ravel())
+    )
+
+
+def split_data(data):
+    """Return contiguous views (masses, positions, velocities)"""
+    # np.asarray: plain ndarray views (not np.memmap)
+    data = np.asarray(data)
+    nb_particles = data.size // 7
+    masses = data[:nb_particles]
+    positions = data[nb_particles : 4 * nb_particles].reshape(nb_particles, 3)
+    velocities = data[4 * nb_particles :].reshape(nb_particles, 3)
+    return masses, positions, velocities
+
+
+def check_data(data, path):
+    """Raise ValueError if the array is not in the binary format"""
+    if data.ndim != 1 or data.size % 7 or data.dtype != np.float64:
+        raise ValueError(
+            f"{path} is not an nbabel binary input (1d float64 array of size "
+            f"7 * N, not {data.ndim}d {data.dtype} of shape {data.shape})"
+        )
+
+
+def to_aos4(masses, positions, velocities):
+    """Return the padded arrays (positions4, velocities4)"""
+    nb_particles = masses.size
+    positions4 = np.empty((nb_particles, 4))
+    positions4[:, :3] = positions
+    positions4[:, 3] = masses
+    velocities4 = np.zeros((nb_particles, 4))
+    velocities4[:, :3] = velocities
+    return positions4, velocities4
+
+
+layouts = ("aos3", "aos4")
+
+
+def save_cache(path, data):
+    path_cache = get_path_cache(path)
+    # caches of previous versions of the input file
+    for path_old in path.parent.glob(f".{path.name}.*_*.npy"):
+        try:
+            path_old.unlink()
+        except OSError:
+            pass
+    # write then rename so that a concurrent reader never sees a partial file
+    path_tmp = path_cache.with_name(f"{path_cache.name}.{os.getpid()}.tmp")
+    try:
+        with open(path_tmp, "wb") as file:
+            np.save(file, data)
+        os.replace(path_tmp, path_cache)
+    except OSError:
+        # read-only directory: no cache
+        try:
+            path_tmp.unlink()
+        except OSError:
+            pass
+
+
+def load_input_data(path, use_cache=True, layout="aos3"):
+    """Return the arrays masses, positions and velocities
+
+    With layout="aos4", positions and velocities are (N, 4) arrays (see the
+    docstring of the module).
+    """
+    if layout not in layouts:
+        raise ValueError(f"Unknown layout {layout!r} (available: {layouts})")
+    path = Path(path)
+    if path.suffix == ".npy":
+        data = np.load(path, mmap_mode="c")
+        check_data(data, path)
+    elif not use_cache:
+        data = read_text(path)
+    else:
+        path_cache = get_path_cache(path)
+        if path_cache.exists():
+            data = np.load(path_cache, mmap_mode="c")
+        else:
+            data = read_text(path)
+            save_cache(path, data)
+    masses, positions, velocities = split_data(data)
+    if layout == "aos4":
+        positions, velocities = to_aos4(masses, positions, velocities)
+        # contiguous copy of the 4th column
+        masses = positions[:, 3].copy()
+    return masses, positions, velocities
+
+
+def load_ensemble(paths, use_cache=True):
+    """Stack several inputs with the same number of particles
+
+    Returns arrays of shapes (n_systems, N), (n_systems, N, 3) and
+    (n_systems, N, 3).
+    """
+    systems = [load_input_data(path, use_cache) for path in paths]
+    sizes = set(masses.size for masses, _, _ in systems)
+    if len(sizes) > 1:
+        raise ValueError(
+            f"The inputs have different numbers of particles ({sorted(sizes)})"
+        )
+    return tuple(np.stack(arrays) for arrays in zip(*systems))
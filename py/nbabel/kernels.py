@@ -0,0 +1,111 @@
+"""Pair kernels shared by the engines and the tools of nbabel
+
+The loop kernels (`*_block`) are not compiled here: Numba is an optional dependency and the
+engines compile them with their own options (for example `nogil=True` for the
+ring decomposition of bench_ring.py).
+
+The kernels compute the interactions of a block of particles 0 with a block
+of particles 1 (i-block x j-block), which is what the decompositions over
+processes need (bench_multiprocessing.py: rows of the full system,
+bench_ring.py: local block x visiting block). The symmetric kernel of
+bench.py (Newton's third law, each pair visited once) cannot be used since
+the accelerations of the particles 1 belong to another process. `offset` is
+the index in the block 1 of the first particle of the block 0, so that the
+self-interactions are skipped when the blocks overlap (no overlap: any
+offset such that index_p0 + offset is never a valid index of the block 1).
+
+compute_potential_energy_rows_numpy is the Numpy kernel for the potential
+energy (by blocks of rows, bounded memory), used when Numba is not
+available and for the generation of the initial conditions.
+
+"""
+
+from math import sqrt
+
+import numpy as np
+
+# number of rows per block for the Numpy kernel (memory ~ 32 * N bytes / row)
+block_size_numpy = 64
+
+
+def compute_accelerations_block(
+    accelerations, positions0, masses1, positions1, offset
+):
+    """Add the accelerations of the particles 0 due to the particles 1"""
+    for index_p0 in range(positions0.shape[0]):
+        x0 = positions0[index_p0, 0]
+        y0 = positions0[index_p0, 1]
+        z0 = positions0[index_p0, 2]
+        ax = ay = az = 0.0
+        for index_p1 in range(positions1.shape[0]):
+            if index_p1 == index_p0 + offset:
+                continue
+            dx = x0 - positions1[index_p1, 0]
+            dy = y0 - positions1[index_p1, 1]
+            dz = z0 - positions1[index_p1, 2]
+            distance2 = dx ** 2 + dy ** 2 + dz ** 2
+            coef = masses1[index_p1] / (distance2 * sqrt(distance2))
+            ax -= coef * dx
+            ay -= coef * dy
+            az -= coef * dz
+        accelerations[index_p0, 0] += ax
+        accelerations[index_p0, 1] += ay
+        accelerations[index_p0, 2] += az
+
+
+def compute_potential_energy_block(
+    masses0, positions0, masses1, positions1, offset
+):
+    """Sum of -m0 m1 / r over the pairs (particle 0, particle 1)
+
+    Each pair of the system is counted twice when all blocks are summed.
+    """
+    energy = 0.0
+    for index_p0 in range(positions0.shape[0]):
+        x0 = positions0[index_p0, 0]
+        y0 = positions0[index_p0, 1]
+        z0 = positions0[index_p0, 2]
+        energy_row = 0.0
+        for index_p1 in range(positions1.shape[0]):
+            if index_p1 == index_p0 + offset:
+                continue
+            distance = sqrt(
+                (x0 - positions1[index_p1, 0]) ** 2
+                + (y0 - positions1[index_p1, 1]) ** 2
+                + (z0 - positions1[index_p1, 2]) ** 2
+            )
+            energy_row -= masses1[index_p1] / distance
+        energy += masses0[index_p0] * energy_row
+    return energy
+
+
+def compute_potential_energy_rows_numpy(
+    masses, positions, start=0, stop=None, block_size=block_size_numpy
+):
+    """Potential energy of the pairs of the rows start:stop (Numpy)
+
+    Half of the sum over the rows start:stop of the full rows, so that the
+    sum over a partition of the rows is the potential energy of the system.
+    """
+    nb_particles = masses.size
+    if stop is None:
+        stop = nb_particles
+    energy = 0.0
+    for start_block in range(start, stop, block_size):
+        stop_block = min(start_block + block_size, stop)
+        distances2 = np.zeros((stop_block - start_block, nb_particles))
+        for i in range(3):
+            distances2 += (
+                positions[start_block:stop_block, i, np.newaxis]
+                - positions[:, i]
+            ) ** 2
+        # the self-interactions
+        distances2[
+            np.arange(stop_block - start_block),
+            np.arange(start_block, stop_block),
+        ] = np.inf
+        energy -= masses[start_block:stop_block] @ (
+            masses / np.sqrt(distances2)
+        ).sum(1)
+    # each pair is counted twice
+    return 0.5 * energy
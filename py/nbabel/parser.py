@@ -0,0 +1,51 @@
+"""Parser of the nbabel text format
+
+Each line contains `id mass x y z vx vy vz` (files from nbabel.org, as in
+../data) or only `mass x y z vx vy vz`. Empty lines are skipped.
+
+Numpy is imported only in `read_input_text` so that `iter_rows` can be used by
+the pure Python implementations (PyPy without Numpy).
+
+"""
+
+
+def count_columns(path):
+    """Number of columns (7 or 8) of the file"""
+    with open(path) as file:
+        for line in file:
+            nb_columns = len(line.split())
+            if nb_columns:
+                break
+        else:
+            raise ValueError(f"No data in {path}")
+    if nb_columns not in (7, 8):
+        raise ValueError(
+            f"Lines of {path} should contain 7 or 8 columns (not {nb_columns})"
+        )
+    return nb_columns
+
+
+def read_input_text(path):
+    """Return an array of shape (nb_particles, 7) (mass, x, y, z, vx, vy, vz)
+
+    Uses the C tokenizer of `np.loadtxt` (Numpy >= 1.23).
+    """
+    import numpy as np
+
+    nb_columns = count_columns(path)
+    return np.loadtxt(
+        path, usecols=range(nb_columns - 7, nb_columns), ndmin=2, comments=None
+    )
+
+
+def iter_rows(path):
+    """Yield tuples (mass, x, y, z, vx, vy, vz) (pure Python)"""
+    nb_columns = count_columns(path)
+    with open(path) as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if len(words) != nb_columns:
+                raise ValueError(f"Bad line in {path}:\n{line}")
+            yield tuple(float(word) for word in words[nb_columns - 7 :])
@@ -0,0 +1,172 @@
+"""Plummer sphere initial conditions (nbabel format)
+
+python -m nbabel plummer 65536 ../data/input64k
+python -m nbabel plummer 1048576 ../data/input1M.npy --seed 1
+
+The particles are sampled as in Aarseth, Hénon and Wielen (1974) and are
+written in N-body (Hénon) units, like the files of ../data: equal masses 1/N,
+centre of mass at rest at the origin, kinetic energy 0.25 and potential
+energy -0.5 (total energy -0.25).
+
+The particles are generated by blocks of `nb_particles_block` particles, each
+block with its own random generator (seeded with (seed, index_block)), so the
+output depends only on N and the seed. The blocks are generated twice: a
+first pass computes the centre of mass and the energies, the second pass
+writes the corrected rows. The memory usage does not grow with N, except to
+compute the exact potential energy (positions kept in memory, O(N**2)
+operations), which is only done by default for N <= 65536. For larger N, the
+potential energy is the expected value (-0.5), so that the total energy is
+-0.25 up to sampling fluctuations of order 1/sqrt(N).
+
+The output is the text format (`id mass x y z vx vy vz`, id = -1 as in the
+files of ../data) or, for paths ending with `.npy`, the binary format of the
+cache of nbabel.input_data (flat float64 array: masses, positions,
+velocities), which can be given directly to `load_input_data`.
+
+"""
+
+from math import pi, sqrt
+
+import numpy as np
+
+from .kernels import compute_potential_energy_rows_numpy
+
+nb_particles_block = 2 ** 16
+nb_particles_max_exact = 2 ** 16
+
+# scales from the standard Plummer units (a = 1) to the Hénon units
+scale_length = 3 * pi / 16
+scale_velocity = 1 / sqrt(scale_length)
+
+
+def sample_block(nb_particles, seed, index_block):
+    """Return positions and velocities (standard Plummer units)"""
+    rng = np.random.default_rng([seed, index_block])
+
+    # radius from the cumulative mass (in (0, 1])
+    mass_fractions = 1.0 - rng.random(nb_particles)
+    radii = 1.0 / np.sqrt(mass_fractions ** (-2 / 3) - 1.0)
+    positions = radii[:, np.newaxis] * random_directions(rng, nb_particles)
+
+    # speed: rejection sampling of g(q) = q**2 (1 - q**2)**3.5 (max < 0.1)
+    ratios = np.empty(0)
+    while ratios.size < nb_particles:
+        candidates = rng.random(2 * (nb_particles - ratios.size))
+        values = 0.1 * rng.random(candidates.size)
+        accepted = values < candidates ** 2 * (1 - candidates ** 2) ** 3.5
+        ratios = np.concatenate((ratios, candidates[accepted]))
+    # ratios of the escape velocities
+    speeds = ratios[:nb_particles] * np.sqrt(2.0) * (1 + radii ** 2) ** -0.25
+    velocities = speeds[:, np.newaxis] * random_directions(rng, nb_particles)
+    return positions, velocities
+
+
+def random_directions(rng, nb_particles):
+    cos_thetas = 1.0 - 2.0 * rng.random(nb_particles)
+    sin_thetas = np.sqrt(1.0 - cos_thetas ** 2)
+    phis = 2 * pi * rng.random(nb_particles)
+    return np.stack(
+        (sin_thetas * np.cos(phis), sin_thetas * np.sin(phis), cos_thetas),
+        axis=1,
+    )
+
+
+def iter_blocks(nb_particles, seed):
+    """Yield (start, positions, velocities) in Hénon units"""
+    for index_block, start in enumerate(
+        range(0, nb_particles, nb_particles_block)
+    ):
+        size = min(nb_particles_block, nb_particles - start)
+        positions, velocities = sample_block(size, seed, index_block)
+        yield start, scale_length * positions, scale_velocity * velocities
+
+
+def compute_potential_energy(positions):
+    """Potential energy (equal masses 1/N), O(N**2) by blocks of rows"""
+    nb_particles = positions.shape[0]
+    masses = np.full(nb_particles, 1.0 / nb_particles)
+    # ~32 MB of temporary arrays
+    block_size = max(1, 2 ** 20 // nb_particles)
+    return compute_potential_energy_rows_numpy(
+        masses, positions, block_size=block_size
+    )
+
+
+def compute_corrections(nb_particles, seed, exact_energy):
+    """Centre of mass (position, velocity) and scale factors"""
+    sum_positions = np.zeros(3)
+    sum_velocities = np.zeros(3)
+    sum_velocities2 = 0.0
+    if exact_energy:
+        positions_all = np.empty((nb_particles, 3))
+    for start, positions, velocities in iter_blocks(nb_particles, seed):
+        sum_positions += positions.sum(axis=0)
+        sum_velocities += velocities.sum(axis=0)
+        sum_velocities2 += np.sum(velocities ** 2)
+        if exact_energy:
+            positions_all[start : start + positions.shape[0]] = positions
+
+    position_com = sum_positions / nb_particles
+    velocity_com = sum_velocities / nb_particles
+    energy_kin = 0.5 * (
+        sum_velocities2 / nb_particles - np.sum(velocity_com ** 2)
+    )
+    if exact_energy:
+        positions_all -= position_com
+        energy_pot = compute_potential_energy(positions_all)
+    else:
+        energy_pot = -0.5
+    # the potential energy scales as 1/length
+    scale_positions = energy_pot / -0.5
+    scale_velocities = sqrt(0.25 / energy_kin)
+    return position_com, velocity_com, scale_positions, scale_velocities
+
+
+def write_plummer(path, nb_particles, seed=0, exact_energy=None):
+    """Write Plummer initial conditions (text or binary if .npy)"""
+    path = str(path)
+    if nb_particles < 2:
+        raise ValueError("nb_particles has to be larger than 1")
+    if exact_energy is None:
+        exact_energy = nb_particles <= nb_particles_max_exact
+
+    (
+        position_com,
+        velocity_com,
+        scale_positions,
+        scale_velocities,
+    ) = compute_corrections(nb_particles, seed, exact_energy)
+
+    def iter_corrected_blocks():
+        for start, positions, velocities in iter_blocks(nb_particles, seed):
+            positions -= position_com
+            positions *= scale_positions
+            velocities -= velocity_com
+            velocities *= scale_velocities
+            yield start, positions, velocities
+
+    mass = 1.0 / nb_particles
+    if path.endswith(".npy"):
+        data = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float64, shape=(7 * nb_particles,)
+        )
+        data[:nb_particles] = mass
+        positions_all = data[nb_particles : 4 * nb_particles].reshape(
+            nb_particles, 3
+        )
+        velocities_all = data[4 * nb_particles :].reshape(nb_particles, 3)
+        for start, positions, velocities in iter_corrected_blocks():
+            stop = start + positions.shape[0]
+            positions_all[start:stop] = positions
+            velocities_all[start:stop] = velocities
+        data.flush()
+        del data, positions_all, velocities_all
+    else:
+        with open(path, "w") as file:
+            for _, positions, velocities in iter_corrected_blocks():
+                rows = np.empty((positions.shape[0], 8))
+                rows[:, 0] = -1
+                rows[:, 1] = mass
+                rows[:, 2:5] = positions
+                rows[:, 5:] = velocities
+                np.savetxt(file, rows, fmt="%.17g")
@@ -0,0 +1,68 @@
+"""Run the engines in new processes and read their timing records
+
+Each run is `python -m nbabel run --timing` in a new process (in the
+directory py), with OMP_NUM_THREADS and NUMBA_NUM_THREADS set to the number
+of threads, so that the number of threads and the compilation caches are
+the ones of a normal run. The times are read from the JSON record printed
+by the loop function (see nbabel.timing).
+
+Used by the benchmark suite (nbabel.suite) and the comparison scripts
+(run_bench_*.py).
+
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+from .engines import path_py
+from .timing import parse_records
+
+
+def run_engine(
+    engine, path_input, t_end, nb_threads=1, options=None, time_step=0.001
+):
+    """Run one simulation in a new process, return (record, energy_error)
+
+    `options` (dict) are passed to the loop function of the engine (see
+    nbabel.engines). Relative input paths are relative to the directory py.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "nbabel",
+        "run",
+        "--engine",
+        engine,
+        "--input",
+        str(path_input),
+        "--t-end",
+        str(t_end),
+        "--time-step",
+        str(time_step),
+        "--timing",
+    ]
+    if options is not None:
+        for name, value in options.items():
+            command += ["-o", f"{name}={value!r}"]
+    env = dict(
+        os.environ,
+        OMP_NUM_THREADS=str(nb_threads),
+        NUMBA_NUM_THREADS=str(nb_threads),
+    )
+    process = subprocess.run(
+        command, cwd=path_py, env=env, capture_output=True, text=True
+    )
+    if process.returncode:
+        lines = (process.stderr or process.stdout).strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else "unknown error")
+    records = parse_records(process.stdout)
+    match = re.search(r"Final dE/E = (\S+)", process.stdout)
+    if not records or match is None:
+        missing = "timing record" if not records else "final energy error"
+        raise RuntimeError(
+            f"No {missing} in the output of {' '.join(command)}:\n"
+            f"{process.stdout}{process.stderr}"
+        )
+    return records[-1], float(match.group(1))
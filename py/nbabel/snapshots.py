@@ -0,0 +1,202 @@
+"""Trajectory snapshots written in a background thread
+
+The state (positions and velocities) is copied into one of a small ring of
+preallocated buffers and a writer thread writes the buffers, so that the
+integration only waits for the copy (or for a free buffer if the writes are
+slower than the computation).
+
+Two formats:
+
+- HDF5 (path ending with `.h5` or `.hdf5`, h5py needed): datasets `positions`
+  and `velocities` of shape (nb_frames, N, 3) (chunks of one frame, optional
+  compression, for example "gzip" or "lzf"), `steps` and `times`, and
+  `masses`,
+- directory of `.npy` frames (other paths): `step_000001000.npy` files
+  containing arrays of shape (2, N, 3) (positions, velocities), `masses.npy`
+  and `metadata.json` (time step). Each frame is written atomically.
+
+As for the HDF5 files (truncated), the frames of a previous run in the
+directory are removed, except when a simulation is restarted
+(step_start > 0): only the frames after step_start are then removed.
+
+The trajectories can be read with nbabel.trajectory.open_trajectory.
+
+"""
+
+import json
+import os
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Thread
+
+import numpy as np
+
+
+class SnapshotWriter:
+    """Base class: subclasses have to define `write_frame` and `close_file`"""
+
+    def __init__(self, nb_particles, nb_buffers=3):
+        self._buffers = [
+            np.empty((2, nb_particles, 3)) for _ in range(nb_buffers)
+        ]
+        self._queue_free = Queue()
+        for index_buffer in range(nb_buffers):
+            self._queue_free.put(index_buffer)
+        self._queue_work = Queue()
+        self._error = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, step, positions, velocities, block=True):
+        """Copy the state in a buffer
+
+        If no buffer is free, waits (block=True) or returns False without
+        copying (block=False).
+        """
+        self._raise_error()
+        try:
+            index_buffer = self._queue_free.get(block)
+        except Empty:
+            return False
+        buffer = self._buffers[index_buffer]
+        np.copyto(buffer[0], positions)
+        np.copyto(buffer[1], velocities)
+        self._queue_work.put((index_buffer, step))
+        return True
+
+    def close(self):
+        """Wait for the pending writes and close the file"""
+        self._queue_work.put(None)
+        self._thread.join()
+        try:
+            self.close_file()
+        finally:
+            self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._queue_work.get()
+            if item is None:
+                break
+            index_buffer, step = item
+            # after an error, the buffers are released without writing
+            if self._error is None:
+                try:
+                    buffer = self._buffers[index_buffer]
+                    self.write_frame(step, buffer[0], buffer[1])
+                except BaseException as error:
+                    self._error = error
+            self._queue_free.put(index_buffer)
+
+    def write_frame(self, step, positions, velocities):
+        raise NotImplementedError
+
+    def close_file(self):
+        pass
+
+
+class NpyFramesWriter(SnapshotWriter):
+    """Directory of .npy frames"""
+
+    def __init__(self, path, masses, time_step, step_start=0, nb_buffers=3):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # new run: all frames are removed, restart: frames after step_start
+        for path_frame in self.path.glob("step_*.npy"):
+            step = int(path_frame.stem[len("step_") :])
+            if not step_start or step > step_start:
+                path_frame.unlink()
+        np.save(self.path / "masses.npy", masses)
+        with open(self.path / "metadata.json", "w") as file:
+            json.dump({"time_step": time_step}, file)
+        super().__init__(masses.size, nb_buffers)
+
+    def write_frame(self, step, positions, velocities):
+        path_frame = self.path / f"step_{step:09d}.npy"
+        path_tmp = path_frame.with_name(f".{path_frame.name}.tmp")
+        with open(path_tmp, "wb") as file:
+            np.save(file, np.stack((positions, velocities)))
+        os.replace(path_tmp, path_frame)
+
+
+class HDF5Writer(SnapshotWriter):
+    """HDF5 file with extendable datasets"""
+
+    def __init__(
+        self,
+        path,
+        masses,
+        time_step,
+        step_start=0,
+        compression=None,
+        nb_buffers=3,
+    ):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError(
+                "h5py is needed for HDF5 snapshots (or use a directory of "
+                ".npy frames)"
+            ) from None
+
+        nb_particles = masses.size
+        self.time_step = time_step
+        self.file = h5py.File(path, "a" if step_start else "w")
+        if "positions" in self.file:
+            # restart: frames after step_start are removed
+            nb_frames = int(np.searchsorted(self.file["steps"][:], step_start))
+            for key in ("positions", "velocities", "steps", "times"):
+                self.file[key].resize(nb_frames, axis=0)
+        else:
+            self.file.attrs["time_step"] = time_step
+            self.file.create_dataset("masses", data=masses)
+            for key in ("positions", "velocities"):
+                self.file.create_dataset(
+                    key,
+                    shape=(0, nb_particles, 3),
+                    maxshape=(None, nb_particles, 3),
+                    chunks=(1, nb_particles, 3),
+                    dtype=np.float64,
+                    compression=compression,
+                )
+            self.file.create_dataset(
+                "steps", shape=(0,), maxshape=(None,), dtype=np.int64
+            )
+            self.file.create_dataset(
+                "times", shape=(0,), maxshape=(None,), dtype=np.float64
+            )
+        super().__init__(nb_particles, nb_buffers)
+
+    def write_frame(self, step, positions, velocities):
+        index_frame = self.file["steps"].shape[0]
+        for key, array in (
+            ("positions", positions),
+            ("velocities", velocities),
+            ("steps", step),
+            ("times", step * self.time_step),
+        ):
+            dataset = self.file[key]
+            dataset.resize(index_frame + 1, axis=0)
+            dataset[index_frame] = array
+        self.file.flush()
+
+    def close_file(self):
+        self.file.close()
+
+
+def create_snapshot_writer(
+    path, masses, time_step, step_start=0, compression=None, nb_buffers=3
+):
+    """HDF5 writer for .h5 and .hdf5 paths, npy frames otherwise"""
+    if Path(path).suffix in (".h5", ".hdf5"):
+        return HDF5Writer(
+            path, masses, time_step, step_start, compression, nb_buffers
+        )
+    if compression is not None:
+        raise ValueError("Compression is only available for HDF5 snapshots")
+    return NpyFramesWriter(path, masses, time_step, step_start, nb_buffers)
@@ -0,0 +1,365 @@
+"""Benchmark suite: sweeps over the engines, the inputs and the threads
+
+python -m nbabel suite --engines pythran numba --threads 1 2 4 --repeat 5
+python -m nbabel suite --max-size 4096 --generate 32768 65536
+
+Each case (engine, number of threads, input) is run `repeat` times (by
+default for ~2**30 / N**2 time steps, between 10 and 1000) in a new
+process (`python -m nbabel run --timing`, see nbabel.timing), with
+OMP_NUM_THREADS and NUMBA_NUM_THREADS set to the number of threads (and the
+options nb_workers / nb_ranks for the multiprocessing and ring engines). The
+number of threads is only varied for the parallel engines. Engines not
+available (Pythran extension not built, missing dependency) are skipped.
+
+The inputs are the reference text files `data/input*` (no suffix, the
+`.npy` files are not used) and, with `--generate`, Plummer spheres written once in `data/.plummer{N}.npy` (see nbabel.plummer).
+
+The results are saved in `{output}.csv` (one row per case: median, min and
+interquartile range of the loop durations, median time of the acceleration
+phase, rates) and `{output}.json` (the same rows, the metadata of the host
+and the fits). For each engine and number of threads, the time of the
+acceleration phase per step is fitted with c * N**2 (least squares on the
+logarithms, inputs with N >= min_size_fit) and with a free exponent, so that
+the constant c (in ns) can be compared between machines and versions.
+
+"""
+
+import csv
+import json
+import os
+import platform
+import re
+import subprocess
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import numpy as np
+
+from .engines import get_engine, path_py
+from .input_data import load_input_data
+from .plummer import write_plummer
+from .runner import run_engine
+from .timing import flops_per_interaction
+
+path_data = path_py.parent / "data"
+
+default_engines = ["pythran", "pythran-omp", "numba", "numba-parallel"]
+
+# engines using several threads or processes (option for the number)
+parallel_engines = {
+    "pythran-omp": None,
+    "pythran-omp-async": None,
+    "numba-parallel": None,
+    "multiprocessing": "nb_workers",
+    "ring": "nb_ranks",
+}
+
+# smaller inputs are dominated by the overheads
+min_size_fit = 256
+
+# default number of time steps: ~ nb_interactions_run / N**2 (bounded), so
+# that the short runs are longer than the resolution of the timers
+nb_interactions_run = 2 ** 30
+nb_steps_min = 10
+nb_steps_max = 1000
+time_step = 0.001
+
+packages = ["numpy", "transonic", "pythran", "numba"]
+
+columns = [
+    "engine",
+    "nb_threads",
+    "nb_particles",
+    "nb_steps",
+    "nb_repeats",
+    "time_median",
+    "time_min",
+    "time_iqr",
+    "time_acc_median",
+    "time_acc_per_step",
+    "interactions_per_s",
+    "gflops",
+    "energy_error",
+    "status",
+]
+
+
+def is_available(name):
+    """False if the module cannot be imported or is not compiled"""
+    engine = get_engine(name)
+    if engine.compiled_func_name is not None:
+        return engine.is_compiled()
+    try:
+        engine.import_module()
+    except ImportError:
+        return False
+    return True
+
+
+def get_host_metadata():
+    cpu_model = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as file:
+            match = re.search(r"model name\s*:\s*(.*)", file.read())
+        if match:
+            cpu_model = match.group(1)
+    except OSError:
+        pass
+    try:
+        nb_cpus_available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        nb_cpus_available = os.cpu_count()
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=path_py,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "cpu_model": cpu_model,
+        "nb_cpus": os.cpu_count(),
+        "nb_cpus_available": nb_cpus_available,
+        "python": platform.python_version(),
+        "versions": versions,
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def get_inputs(max_size=None, sizes_generated=(), seed=0):
+    """Sorted list of (nb_particles, path)"""
+    inputs = {}
+    for path in path_data.glob("input*"):
+        # only the reference text inputs (not for example input1M.npy
+        # written by `python -m nbabel plummer`, see --generate)
+        if path.suffix:
+            continue
+        nb_particles = load_input_data(path)[0].size
+        inputs[nb_particles] = path
+    for nb_particles in sizes_generated:
+        if max_size is not None and nb_particles > max_size:
+            continue
+        path = path_data / f".plummer{nb_particles}.npy"
+        if not path.exists():
+            print(f"writing {path}")
+            write_plummer(path, nb_particles, seed)
+        inputs[nb_particles] = path
+    return sorted(
+        (nb_particles, path)
+        for nb_particles, path in inputs.items()
+        if max_size is None or nb_particles <= max_size
+    )
+
+
+def compute_t_end(nb_particles):
+    """Default end time (number of time steps depending on N)"""
+    nb_steps = nb_interactions_run // nb_particles ** 2
+    nb_steps = min(max(nb_steps, nb_steps_min), nb_steps_max)
+    # nb_steps = int(t_end / time_step) + 1 (see nbabel.driver)
+    return (nb_steps - 0.5) * time_step
+
+
+def run_case(engine, path_input, t_end, nb_threads):
+    """Run one simulation in a new process, return (record, energy_error)"""
+    option = parallel_engines.get(engine)
+    options = None if option is None else {option: nb_threads}
+    return run_engine(
+        engine, path_input, t_end, nb_threads, options, time_step
+    )
+
+
+def compute_stats(engine, nb_threads, records, energy_error):
+    """Row of the results from the records of the repeated runs"""
+    durations = np.array([record["total"] for record in records])
+    durations_acc = np.array(
+        [
+            sum(record["phases"].get(name, 0.0) for name in ("acc", "step"))
+            for record in records
+        ]
+    )
+    nb_particles = records[0]["nb_particles"]
+    nb_steps = records[0]["nb_steps"]
+    time_median = float(np.median(durations))
+    time_acc_median = float(np.median(durations_acc))
+    q25, q75 = np.percentile(durations, [25, 75])
+    if time_acc_median > 0:
+        interactions_per_s = (
+            nb_steps * nb_particles * (nb_particles - 1) / time_acc_median
+        )
+    else:
+        interactions_per_s = float("nan")
+    return {
+        "engine": engine,
+        "nb_threads": nb_threads,
+        "nb_particles": nb_particles,
+        "nb_steps": nb_steps,
+        "nb_repeats": len(records),
+        "time_median": time_median,
+        "time_min": float(durations.min()),
+        "time_iqr": float(q75 - q25),
+        "time_acc_median": time_acc_median,
+        "time_acc_per_step": time_acc_median / nb_steps,
+        "interactions_per_s": interactions_per_s,
+        "gflops": interactions_per_s * flops_per_interaction / 1e9,
+        "energy_error": energy_error,
+        "status": "ok",
+    }
+
+
+def fit_n2(rows):
+    """Fits of the acceleration time per step (rows of one engine/threads)"""
+    rows = [
+        row
+        for row in rows
+        if row["status"] == "ok"
+        and row["nb_particles"] >= min_size_fit
+        and row["time_acc_per_step"] > 0
+    ]
+    if not rows:
+        return None
+    log_sizes = np.log([row["nb_particles"] for row in rows])
+    log_times = np.log([row["time_acc_per_step"] for row in rows])
+    # t = c * N**2
+    constant = float(np.exp(np.mean(log_times - 2 * log_sizes)))
+    if len(rows) > 1:
+        exponent = float(np.polyfit(log_sizes, log_times, 1)[0])
+    else:
+        exponent = None
+    return {
+        "engine": rows[0]["engine"],
+        "nb_threads": rows[0]["nb_threads"],
+        "nb_inputs": len(rows),
+        "constant_ns": 1e9 * constant,
+        "exponent": exponent,
+    }
+
+
+def run_suite(
+    engines=None,
+    threads=None,
+    repeat=3,
+    t_end=None,
+    max_size=None,
+    sizes_generated=(),
+    output="bench_suite",
+):
+    """Run the cases and save the results (returns the results dict)"""
+    if engines is None:
+        engines = default_engines
+    if threads is None:
+        threads = [os.cpu_count()]
+    if repeat < 1:
+        raise ValueError(f"repeat has to be positive (not {repeat})")
+
+    metadata = get_host_metadata()
+    inputs = get_inputs(max_size, sizes_generated)
+    if not inputs:
+        raise ValueError("No input file")
+
+    results = {
+        "host": metadata,
+        "parameters": {
+            "engines": engines,
+            "threads": threads,
+            "repeat": repeat,
+            "t_end": t_end,
+            "min_size_fit": min_size_fit,
+        },
+        "results": [],
+        "fits": [],
+    }
+    for engine in engines:
+        if not is_available(engine):
+            print(f"{engine}: not available (skipped)")
+            continue
+        threads_engine = threads if engine in parallel_engines else [1]
+        for nb_threads in threads_engine:
+            # warmup (Numba cache, first import of the extensions)
+            try:
+                run_case(engine, inputs[0][1], 0.0, nb_threads)
+            except RuntimeError:
+                pass
+            rows = []
+            for nb_particles, path_input in inputs:
+                if t_end is None:
+                    t_end_case = compute_t_end(nb_particles)
+                else:
+                    t_end_case = t_end
+                try:
+                    runs = [
+                        run_case(engine, path_input, t_end_case, nb_threads)
+                        for _ in range(repeat)
+                    ]
+                except RuntimeError as error:
+                    row = dict.fromkeys(columns)
+                    row.update(
+                        engine=engine,
+                        nb_threads=nb_threads,
+                        nb_particles=nb_particles,
+                        status=f"error: {error}",
+                    )
+                else:
+                    records = [record for record, _ in runs]
+                    row = compute_stats(
+                        engine, nb_threads, records, runs[-1][1]
+                    )
+                print(format_row(row), flush=True)
+                rows.append(row)
+            results["results"].extend(rows)
+            fit = fit_n2(rows)
+            if fit is not None:
+                results["fits"].append(fit)
+                print(format_fit(fit), flush=True)
+            # saved after each engine so that a long run can be interrupted
+            save_results(output, results)
+    print(f"results saved in {output}.csv and {output}.json")
+    return results
+
+
+def format_row(row):
+    text = (
+        f"{row['engine']:>17s} {row['nb_threads']:3d} threads "
+        f"{row['nb_particles']:8d} particles: "
+    )
+    if row["status"] != "ok":
+        return text + row["status"]
+    return text + (
+        f"{row['time_median']:.4f} s (min {row['time_min']:.4f} s, "
+        f"IQR {row['time_iqr']:.1e} s), {row['gflops']:.2f} GFLOP/s"
+    )
+
+
+def format_fit(fit):
+    text = (
+        f"{fit['engine']:>17s} {fit['nb_threads']:3d} threads: "
+        f"t_acc/step = {fit['constant_ns']:.4g} ns * N**2"
+    )
+    if fit["exponent"] is not None:
+        text += f" (fitted exponent {fit['exponent']:.3f})"
+    return text
+
+
+def save_results(output, results):
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    path_csv = output.with_name(output.name + ".csv")
+    with open(path_csv, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results["results"])
+    path_json = output.with_name(output.name + ".json")
+    with open(path_json, "w") as file:
+        json.dump(results, file, indent=2)
@@ -0,0 +1,137 @@
+"""Per-phase timing of the loop functions, emitted as JSON lines
+
+With the option `timing=True` (`python -m nbabel run ... --timing`), the loop
+function of each engine prints one JSON line at its end, for example:
+
+```
+{"engine": "pythran", "nb_particles": 1024, "nb_steps": 101,
+ "phases": {"pos": 0.0004, "acc": 0.51, "vel": 0.0003, "ener": 0.0052},
+ "total": 0.52, "interactions_per_s": 2.1e+08, "gflops": 4.1}
+```
+
+(on one line). The phases are "pos" and "vel" (advance the positions and
+the velocities), "acc" (accelerations), "ener" (energies and prints) and,
+for some engines, "swap" (swap/copy of the accelerations) or "step" (the
+three first phases, when they cannot be separated). The lines are
+recognized by their first character "{".
+
+`interactions_per_s` and `gflops` are computed from the time of the phases
+including the accelerations ("acc" or "step"), with N(N-1) interactions per
+time step (particle i acting on particle j, the symmetric kernels compute
+two interactions per pair) and 20 floating point operations per
+interaction, as in Nyland et al. (GPU Gems 3, ch. 31). For the tree code,
+these are the equivalent direct-summation rates.
+
+The compiled loops (Pythran, Numba) measure their phases with their own
+accumulators. The Pythran functions (`loop_phases`) return the durations (in
+the order of `phases_compiled`) to a Python wrapper (`loop`) calling
+`emit_durations`. Note that `time.time` has a resolution of 1 ms in Pythran:
+the sums over the time steps are unbiased but the short phases ("pos",
+"vel", "swap") are noisy for short runs. The Python loops use PhaseTimers:
+
+```python
+timers = PhaseTimers(enabled=timing)
+with timers.phase("acc"):
+    compute_accelerations(accelerations, masses, positions)
+timers.emit("numpy", nb_particles, nb_steps)
+```
+
+When disabled, `phase` returns a shared context manager doing nothing
+(overhead ~0.1 µs per phase) and `emit` prints nothing.
+
+"""
+
+import json
+from time import perf_counter
+
+flops_per_interaction = 20
+
+# phases containing the computation of the accelerations
+phases_acc = ("acc", "step")
+
+# order of the durations returned by the compiled loops
+phases_compiled = ("pos", "swap", "acc", "vel", "ener")
+
+
+class _NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+null_phase = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("durations", "name", "t_start")
+
+    def __init__(self, durations, name):
+        self.durations = durations
+        self.name = name
+
+    def __enter__(self):
+        self.t_start = perf_counter()
+
+    def __exit__(self, *args):
+        duration = perf_counter() - self.t_start
+        self.durations[self.name] = self.durations.get(self.name, 0.0) + duration
+
+
+class PhaseTimers:
+    """Accumulate the durations of named phases"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.durations = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return null_phase
+        return _Phase(self.durations, name)
+
+    def add(self, name, duration):
+        if self.enabled:
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def emit(self, engine, nb_particles, nb_steps, file=None):
+        """Print the JSON line (nothing if disabled)"""
+        if self.enabled:
+            record = make_record(engine, nb_particles, nb_steps, self.durations)
+            print(json.dumps(record), file=file, flush=True)
+
+
+def emit_durations(engine, nb_particles, nb_steps, durations, file=None):
+    """Print the JSON line of a compiled loop (durations of phases_compiled)"""
+    timers = PhaseTimers()
+    for name, duration in zip(phases_compiled, durations):
+        timers.add(name, float(duration))
+    timers.emit(engine, nb_particles, nb_steps, file)
+
+
+def make_record(engine, nb_particles, nb_steps, durations):
+    """Record (dict) with the phases and the derived rates"""
+    nb_particles = int(nb_particles)
+    time_acc = sum(durations.get(name, 0.0) for name in phases_acc)
+    nb_interactions = nb_steps * nb_particles * (nb_particles - 1)
+    if time_acc > 0:
+        interactions_per_s = nb_interactions / time_acc
+    else:
+        interactions_per_s = float("nan")
+    return {
+        "engine": engine,
+        "nb_particles": nb_particles,
+        "nb_steps": nb_steps,
+        "phases": dict(durations),
+        "total": sum(durations.values()),
+        "interactions_per_s": interactions_per_s,
+        "gflops": interactions_per_s * flops_per_interaction / 1e9,
+    }
+
+
+def parse_records(text):
+    """Records (dicts) of the JSON lines contained in the output of a run"""
+    return [
+        json.loads(line) for line in text.splitlines() if line.startswith("{")
+    ]
@@ -0,0 +1,152 @@
+"""Read the trajectories written by nbabel.snapshots
+
+```python
+from nbabel.trajectory import open_trajectory
+
+with open_trajectory("traj16k.h5") as trajectory:
+    positions, velocities = trajectory.get_frame(10)
+    # positions of 3 particles for one frame over 10
+    series = trajectory.get_time_series([0, 10, 100], step=10)
+```
+
+The frames are returned as read-only memory-mapped arrays (np.memmap, no copy
+and nothing read before the data is used):
+
+- directory of `.npy` frames: views of the memory-mapped frame files,
+- HDF5: one frame is one chunk, the chunk is memory-mapped from its offset in
+  the file. This is not possible for compressed datasets, for which the
+  frames are read (copies).
+
+The time series are built from the memory-mapped frames, so only the pages
+containing the selected particles are read.
+
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class Trajectory:
+    """Base class: subclasses have to define `_get_frame_arrays`
+
+    Attributes `masses`, `steps` and `times` (arrays).
+    """
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def _check_index(self, index_frame):
+        nb_frames = len(self)
+        if not -nb_frames <= index_frame < nb_frames:
+            raise IndexError(
+                f"Frame {index_frame} out of range ({nb_frames} frames)"
+            )
+        return index_frame % nb_frames
+
+    def get_frame(self, index_frame):
+        """Return (positions, velocities) of a frame (memory-mapped)"""
+        index_frame = self._check_index(index_frame)
+        return self._get_frame_arrays(index_frame)
+
+    def get_time_series(
+        self,
+        indices_particles,
+        start=0,
+        stop=None,
+        step=1,
+        quantity="positions",
+    ):
+        """Array (nb_frames, nb_particles, 3) for a subset of the particles
+
+        The frames are range(start, stop, step), `quantity` is "positions"
+        or "velocities".
+        """
+        try:
+            index_quantity = ("positions", "velocities").index(quantity)
+        except ValueError:
+            raise ValueError(
+                f"quantity has to be 'positions' or 'velocities' "
+                f"(not {quantity!r})"
+            ) from None
+        indices_particles = np.asarray(indices_particles)
+        indices_frames = range(len(self))[start:stop:step]
+        result = np.empty((len(indices_frames), indices_particles.size, 3))
+        for index_result, index_frame in enumerate(indices_frames):
+            arrays = self._get_frame_arrays(index_frame)
+            result[index_result] = arrays[index_quantity][indices_particles]
+        return result
+
+
+class NpyFramesTrajectory(Trajectory):
+    """Directory of .npy frames"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.paths_frames = sorted(self.path.glob("step_*.npy"))
+        self.steps = np.array(
+            [int(path.stem[len("step_") :]) for path in self.paths_frames],
+            dtype=np.int64,
+        )
+        with open(self.path / "metadata.json") as file:
+            self.time_step = json.load(file)["time_step"]
+        self.times = self.steps * self.time_step
+        self.masses = np.load(self.path / "masses.npy", mmap_mode="r")
+
+    def _get_frame_arrays(self, index_frame):
+        frame = np.load(self.paths_frames[index_frame], mmap_mode="r")
+        return frame[0], frame[1]
+
+
+class HDF5Trajectory(Trajectory):
+    """HDF5 file"""
+
+    def __init__(self, path):
+        import h5py
+
+        self.path = Path(path)
+        self.file = h5py.File(path, "r")
+        self.steps = self.file["steps"][:]
+        self.times = self.file["times"][:]
+        self.time_step = self.file.attrs["time_step"]
+        self.masses = self.file["masses"][:]
+        self.datasets = [self.file["positions"], self.file["velocities"]]
+
+    def close(self):
+        self.file.close()
+
+    def _get_frame_arrays(self, index_frame):
+        return tuple(
+            self._get_frame_array(dataset, index_frame)
+            for dataset in self.datasets
+        )
+
+    def _get_frame_array(self, dataset, index_frame):
+        shape = dataset.shape[1:]
+        if dataset.compression is not None or dataset.chunks != (1, *shape):
+            return dataset[index_frame]
+        info = dataset.id.get_chunk_info_by_coord((index_frame, 0, 0))
+        return np.memmap(
+            self.path,
+            dtype=dataset.dtype,
+            mode="r",
+            offset=info.byte_offset,
+            shape=shape,
+        )
+
+
+def open_trajectory(path):
+    """HDF5 for .h5 and .hdf5 paths, directory of npy frames otherwise"""
+    if Path(path).suffix in (".h5", ".hdf5"):
+        return HDF5Trajectory(path)
+    return NpyFramesTrajectory(path)
@@ -0,0 +1,123 @@
+"""Point-to-point transports for the ring decomposition (bench_ring.py)
+
+A transport connects a rank to the next and previous ranks of a ring. Arrays
+are sent as raw bytes (no pickle) with the `send_bytes` / `recv_bytes_into`
+methods of multiprocessing.connection.Connection objects, which are used both
+for pipes (one machine) and sockets (multiprocessing.connection.Listener and
+Client, also usable between machines).
+
+The messages are sent from a thread so that all ranks can send and receive
+at the same time (no deadlock when the messages are larger than the buffers
+of the pipes) and so that the communication overlaps the computation of
+kernels releasing the GIL.
+
+"""
+
+import time
+from multiprocessing import Pipe
+from multiprocessing.connection import Client, Listener
+from threading import Thread
+
+import numpy as np
+
+
+class Transport:
+    """Base class: subclasses have to define `send` and `recv_into`"""
+
+    def send(self, array):
+        raise NotImplementedError
+
+    def recv_into(self, array):
+        """Receive in a contiguous array, return the number of items"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def start_shift(self, array_send, array_recv):
+        """Start sending to the next rank and receiving from the previous
+
+        Returns a function waiting for the end of the shift.
+        """
+        sender = Thread(target=self.send, args=(array_send,))
+        sender.start()
+        result = []
+        receiver = Thread(
+            target=lambda: result.append(self.recv_into(array_recv))
+        )
+        receiver.start()
+
+        def wait():
+            sender.join()
+            receiver.join()
+            return result[0]
+
+        return wait
+
+    def allreduce_sum(self, value, nb_ranks):
+        """Sum of the values of all ranks (passed around the ring)"""
+        buffer_send = np.array([value], dtype=np.float64)
+        buffer_recv = np.empty_like(buffer_send)
+        total = value
+        for _ in range(nb_ranks - 1):
+            self.start_shift(buffer_send, buffer_recv)()
+            total += buffer_recv[0]
+            buffer_send, buffer_recv = buffer_recv, buffer_send
+        return total
+
+
+class ConnectionTransport(Transport):
+    """Transport over multiprocessing.connection.Connection objects"""
+
+    def __init__(self, connection_next, connection_previous):
+        self.connection_next = connection_next
+        self.connection_previous = connection_previous
+
+    def send(self, array):
+        self.connection_next.send_bytes(memoryview(array).cast("B"))
+
+    def recv_into(self, array):
+        nbytes = self.connection_previous.recv_bytes_into(
+            memoryview(array).cast("B")
+        )
+        return nbytes // array.itemsize
+
+    def close(self):
+        self.connection_next.close()
+        self.connection_previous.close()
+
+
+def create_pipe_transports(nb_ranks):
+    """Transports of all ranks of a ring on one machine (to be passed to the
+    processes at creation)"""
+    # links[rank]: rank -> rank + 1
+    links = [Pipe(duplex=False) for _ in range(nb_ranks)]
+    return [
+        ConnectionTransport(links[rank][1], links[rank - 1][0])
+        for rank in range(nb_ranks)
+    ]
+
+
+def create_socket_transport(rank, addresses, timeout=60.0):
+    """Transport of one rank of a ring over sockets
+
+    `addresses` are the (host, port) of the ranks, to be called in each rank.
+    There is no authentication, so use addresses of a trusted network.
+    """
+    nb_ranks = len(addresses)
+    listener = Listener(addresses[rank])
+    address_next = addresses[(rank + 1) % nb_ranks]
+    t_start = time.monotonic()
+    while True:
+        try:
+            connection_next = Client(address_next)
+        except ConnectionRefusedError:
+            # the next rank is not yet listening
+            if time.monotonic() - t_start > timeout:
+                raise
+            time.sleep(0.01)
+        else:
+            break
+    connection_previous = listener.accept()
+    listener.close()
+    return ConnectionTransport(connection_next, connection_previous)
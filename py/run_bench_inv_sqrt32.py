@@ -0,0 +1,49 @@
+"""
+Accuracy and speed of the float32 1/sqrt + Newton-Raphson kernel of bench.py
+
+python run_bench_inv_sqrt32.py 0.1 ../data/input1k ../data/input2k
+
+For each input and number of Newton-Raphson iterations (-1: float64 sqrt and
+division), the time of the loop (JSON record of --timing) and the final
+relative error on the energy are given, as well as the difference of this
+error with the reference one.
+
+warning: this script does not take care of compilation (make bench1k).
+
+"""
+
+import sys
+
+from nbabel.runner import run_engine
+
+nb_newton_list = [-1, 0, 1, 2, 3]
+
+
+def run(path_input, t_end, nb_newton):
+    options = {"nb_newton_float32": nb_newton}
+    record, error = run_engine("pythran", path_input, t_end, options=options)
+    return record["total"], error
+
+
+if __name__ == "__main__":
+
+    t_end = float(sys.argv[1])
+    paths_input = sys.argv[2:]
+    if not paths_input:
+        paths_input = [f"../data/input{size}" for size in ("1k", "2k", "16k")]
+
+    print(f"t_end = {t_end}")
+    print(
+        f"{'input':>18s} {'newton':>6s} {'time (s)':>9s} {'speedup':>8s} "
+        f"{'Final dE/E':>13s} {'diff dE/E':>10s}"
+    )
+    for path_input in paths_input:
+        for nb_newton in nb_newton_list:
+            duration, error = run(path_input, t_end, nb_newton)
+            if nb_newton == -1:
+                duration_ref, error_ref = duration, error
+            print(
+                f"{path_input:>18s} {nb_newton:6d} {duration:9.3f} "
+                f"{duration_ref / duration:8.2f} {error:13.6e} "
+                f"{abs(error - error_ref):10.1e}"
+            )
@@ -0,0 +1,47 @@
+"""
+Compare the float64 and the mixed precision modes of bench.py
+
+- "float64": bench.py kernel,
+- "mixed": relative positions and 1/r**3 in float32, accumulation in float64.
+
+python run_bench_mixed_precision.py ../data/input16k 0.01
+
+Both the time of the loop (JSON record of --timing) and the final relative
+error on the energy are given.
+
+warning: this script does not take care of compilation (make bench1k).
+
+"""
+
+import sys
+
+from nbabel.runner import run_engine
+
+modes = {"float64": False, "mixed": True}
+
+
+def run(path_input, t_end, mixed_precision):
+    options = {"mixed_precision": mixed_precision}
+    record, error = run_engine("pythran", path_input, t_end, options=options)
+    return record["total"], error
+
+
+if __name__ == "__main__":
+
+    path_input = sys.argv[1]
+    try:
+        t_end = float(sys.argv[2])
+    except IndexError:
+        t_end = 0.01
+
+    print(f"{path_input}, t_end = {t_end}")
+    print(f"{'mode':>8s} {'time (s)':>9s} {'speedup':>8s} {'Final dE/E':>13s}")
+    duration_ref = None
+    for mode, mixed_precision in modes.items():
+        duration, error = run(path_input, t_end, mixed_precision)
+        if duration_ref is None:
+            duration_ref = duration
+        print(
+            f"{mode:>8s} {duration:9.3f} {duration_ref / duration:8.2f} "
+            f"{error:13.6e}"
+        )
@@ -0,0 +1,66 @@
+"""
+Thread scaling of the parallel kernels of bench_numba.py
+
+The parallel kernels (prange) compute full rows of accelerations (each thread
+writes its rows, no per-thread copies) and the potential energy with a
+prange reduction. The full-row kernel computes 2 times more pairs than the
+sequential symmetric kernel, so the speedups are given relative to the
+parallel kernels run with 1 thread (the sequential run is given for
+reference).
+
+python run_bench_numba_threads.py ../data/input2k 0.1
+
+The times are the times of the loop (JSON record of --timing, see
+nbabel.timing), without the loading of the Numba cache (a first run fills
+the cache).
+
+"""
+
+import os
+import sys
+
+from nbabel.runner import run_engine
+
+nb_threads_list = [1, 2, 4, 8, 16, 32]
+
+
+def run(path_input, t_end, nb_threads):
+    """nb_threads = 0: sequential kernels"""
+    if nb_threads:
+        record, _ = run_engine("numba-parallel", path_input, t_end, nb_threads)
+    else:
+        record, _ = run_engine("numba", path_input, t_end)
+    return record["total"]
+
+
+if __name__ == "__main__":
+
+    path_input = sys.argv[1]
+    try:
+        t_end = float(sys.argv[2])
+    except IndexError:
+        t_end = 0.1
+
+    nb_cpus = os.cpu_count()
+    print(f"{path_input}, t_end = {t_end}, {nb_cpus} cpus")
+
+    # compilation (Numba cache)
+    run(path_input, 0.001, 0)
+    run(path_input, 0.001, 1)
+
+    duration_seq = run(path_input, t_end, 0)
+    duration_1thread = run(path_input, t_end, 1)
+    print(f"{'threads':>10s} {'time (s)':>9s} {'speedup':>8s}")
+    print(
+        f"{'sequential':>10s} {duration_seq:9.3f} "
+        f"{duration_1thread / duration_seq:8.2f}"
+    )
+    print(f"{1:10d} {duration_1thread:9.3f} {1:8.2f}")
+    for nb_threads in nb_threads_list[1:]:
+        if nb_threads > nb_cpus:
+            break
+        duration = run(path_input, t_end, nb_threads)
+        print(
+            f"{nb_threads:10d} {duration:9.3f} "
+            f"{duration_1thread / duration:8.2f}"
+        )
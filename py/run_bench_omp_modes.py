@@ -0,0 +1,53 @@
+"""
+Compare the two parallel modes of bench_omp.py
+
+- "thread copies": one copy of the accelerations per thread + reduction,
+- "full row": each thread computes full rows, one acceleration array.
+
+python run_bench_omp_modes.py ../data/input16k 0.01
+
+warning: this script does not take care of compilation (make bench1k_omp).
+
+"""
+
+import os
+import sys
+
+from nbabel.runner import run_engine
+
+nb_threads_list = [1, 8, 32, 64]
+modes = {"thread copies": False, "full row": True}
+
+
+def run(path_input, t_end, nb_threads, full_row):
+    record, _ = run_engine(
+        "pythran-omp", path_input, t_end, nb_threads, {"full_row": full_row}
+    )
+    return record["phases"]["acc"]
+
+
+if __name__ == "__main__":
+
+    path_input = sys.argv[1]
+    try:
+        t_end = float(sys.argv[2])
+    except IndexError:
+        t_end = 0.01
+
+    with open(path_input) as file:
+        nb_particles = sum(1 for line in file if line.strip())
+
+    print(f"{nb_particles} particles, t_end = {t_end}, {os.cpu_count()} cpus")
+    print(
+        f"{'mode':>14s} {'threads':>7s} {'time acc (s)':>12s} "
+        f"{'accelerations memory (MB)':>25s}"
+    )
+    for nb_threads in nb_threads_list:
+        for mode, full_row in modes.items():
+            duration = run(path_input, t_end, nb_threads, full_row)
+            nb_copies = 1 if full_row else nb_threads
+            # 2 arrays of shape [nb_copies, nb_particles, 3]
+            memory = 2 * nb_copies * nb_particles * 3 * 8 / 1e6
+            print(
+                f"{mode:>14s} {nb_threads:7d} {duration:12.3f} {memory:25.1f}"
+            )